@@ -0,0 +1,81 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Compares looking up a single configuration through :func:`name2file` with the
+direct lookup performed by :func:`get_file`, using configuration folders
+containing a large number of entries::
+
+    python bench/conf_lookup.py --sizes 10 100 1000
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import timeit
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+from score.cli.conf import get_file, name2file  # noqa: E402
+
+
+def populate(folder, count):
+    for subfolder in ('home', 'venv'):
+        conf = os.path.join(folder, subfolder, '.score', 'conf')
+        os.makedirs(conf)
+        for i in range(count):
+            open(os.path.join(conf, 'tenant-%05d' % i), 'w').close()
+    os.environ['HOME'] = os.path.join(folder, 'home')
+    return os.path.join(folder, 'venv')
+
+
+def measure(count, number):
+    with tempfile.TemporaryDirectory() as folder:
+        venv = populate(folder, count)
+        name = 'tenant-%05d' % (count // 2)
+        assert name2file(venv=venv)[name] == get_file(name, venv=venv)
+        old = timeit.timeit(lambda: name2file(venv=venv)[name],
+                            number=number)
+        new = timeit.timeit(lambda: get_file(name, venv=venv),
+                            number=number)
+    print('%6d entries  name2file %9.1fus  get_file %7.1fus  (x%.0f)' % (
+        count, old / number * 1e6, new / number * 1e6, old / new))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[10, 100, 1000])
+    parser.add_argument('--number', type=int, default=200)
+    args = parser.parse_args()
+    for count in args.sizes:
+        measure(count, args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,347 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Verifies the results of the caching and partial initialization shortcuts
+taken by :mod:`score.cli` against the straightforward implementations::
+
+    python bench/consistency.py
+"""
+
+import os
+import sys
+import tempfile
+import textwrap
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+checks = []
+
+
+def check(func):
+    checks.append(func)
+    return func
+
+
+def write(folder, name, content):
+    file = os.path.join(folder, name)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'w') as fp:
+        fp.write(textwrap.dedent(content).lstrip())
+    return file
+
+
+@check
+def partial_init_overrides(folder):
+    """
+    Modules skipped by a partial load must honour the overrides of that load.
+    """
+    write(folder, 'consistency_mods/__init__.py', '')
+    for name, deps in (('moda', ''), ('modc', '')):
+        write(folder, 'consistency_mods/%s.py' % name, '''
+            from score.init import ConfiguredModule
+
+            def init(confdict%s):
+                conf = ConfiguredModule(__name__)
+                conf.value = confdict.get('value')
+                return conf
+            ''' % deps)
+    file = write(folder, 'partial.conf', '''
+        [score.init]
+        modules =
+            consistency_mods.moda
+            consistency_mods.modc
+
+        [modc]
+        value = C
+        ''')
+    sys.path.insert(0, folder)
+    from score.cli.clibase import Configuration
+    overrides = {'modc': {'value': 'OVERRIDDEN'}}
+    full = Configuration(file).load(overrides=overrides).modc.value
+    partial = Configuration(file).load(
+        modules=['moda'], overrides=overrides).modc.value
+    assert full == partial == 'OVERRIDDEN', (full, partial)
+
+
+@check
+def partial_init_once(folder):
+    """
+    Modules skipped by a partial load are initialized into the same score
+    object, without initializing the loaded modules a second time.
+    """
+    write(folder, 'lazy_mods/__init__.py', '')
+    write(folder, 'lazy_mods/moda.py', '''
+        from score.init import ConfiguredModule
+
+        count = 0
+
+        def init(confdict):
+            global count
+            count += 1
+            return ConfiguredModule(__name__)
+        ''')
+    write(folder, 'lazy_mods/modb.py', '''
+        from score.init import ConfiguredModule
+
+        def init(confdict, a):
+            conf = ConfiguredModule(__name__)
+            conf.a = a
+            conf.value = confdict.get('value')
+            return conf
+        ''')
+    file = write(folder, 'lazy.conf', '''
+        [score.init]
+        modules =
+            lazy_mods.moda:ma
+            lazy_mods.modb:mb(a=ma)
+
+        [mb]
+        value = B
+        ''')
+    sys.path.insert(0, folder)
+    from score.cli.clibase import Configuration
+    import lazy_mods.moda
+    score = Configuration(file).load(modules=['ma'])
+    assert score.mb.value == 'B', score.mb.value
+    assert score.mb.a is score.ma, (score.mb.a, score.ma)
+    assert lazy_mods.moda.count == 1, lazy_mods.moda.count
+
+
+@check
+def load_defaults(folder):
+    """
+    Modules receive the same confdicts as with :func:`score.init_from_file`.
+    """
+    write(folder, 'defaults_mods/__init__.py', '')
+    write(folder, 'defaults_mods/mod.py', '''
+        from score.init import ConfiguredModule
+
+        def init(confdict):
+            conf = ConfiguredModule(__name__)
+            conf.confdict = dict(confdict)
+            return conf
+        ''')
+    plain = write(folder, 'plain.conf', '''
+        [score.init]
+        modules = defaults_mods.mod
+
+        [mod]
+        path = ${here}/data
+        ''')
+    based = write(folder, 'based.conf', '''
+        [score.init]
+        based_on = plain.conf
+
+        [mod]
+        other = value
+        ''')
+    sys.path.insert(0, folder)
+    from score.init import init_from_file
+    from score.cli.clibase import Configuration
+    for file in (plain, based):
+        expected = init_from_file(file).mod.confdict
+        actual = Configuration(file).load().mod.confdict
+        assert expected == actual, (file, expected, actual)
+
+
+@check
+def include_added(folder):
+    """
+    Adding a file matching an include pattern invalidates cached results.
+    """
+    file = write(folder, 'app.conf', """
+        [score.init]
+        include = ${here}/conf.d/*.conf
+        """)
+    write(folder, 'conf.d/1.conf', """
+        [one]
+        key = 1
+        """)
+    from score.init import parse_config_file
+    from score.cli.clibase import Configuration
+    configuration = Configuration(file)
+    configuration.parse()
+    write(folder, 'conf.d/2.conf', """
+        [two]
+        key = 2
+        """)
+    expected = parse_config_file(file)
+    actual = Configuration(file).parse()
+    assert 'two' in expected, expected
+    assert 'two' in actual, actual
+    assert 'two' in configuration.parse(), 'cached in memory'
+
+
+@check
+def include_added_compiled(folder):
+    """
+    Snapshots created by ``score conf compile`` become invalid when a file
+    starts matching one of their include patterns.
+    """
+    file = write(folder, 'app.conf', """
+        [score.init]
+        include = ${here}/conf.d/*.conf
+        """)
+    write(folder, 'conf.d/1.conf', """
+        [one]
+        key = 1
+        """)
+    from score.cli.parsecache import ParseCache, compiled_folder
+    ParseCache(compiled_folder, readonly=True).compile(file)
+    write(folder, 'conf.d/2.conf', """
+        [two]
+        key = 2
+        """)
+    # a fresh cache only knows the snapshot on disk, like a new process
+    actual = ParseCache(compiled_folder, readonly=True).parse(file)
+    assert 'two' in actual, actual
+
+
+@check
+def lock_threads(folder):
+    """
+    Overlapping threads must not leave the registry lock in a state where
+    later callers skip the file lock.
+    """
+    import threading
+    import time
+    from score.cli import conf
+    target = os.path.join(folder, 'locked')
+    inside = []
+    overlaps = []
+
+    def hold():
+        with conf._locked(target):
+            inside.append(threading.get_ident())
+            time.sleep(0.05)
+            with conf._locked(target):
+                pass
+            inside.remove(threading.get_ident())
+            if inside:
+                overlaps.append(list(inside))
+    threads = [threading.Thread(target=hold) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not overlaps, 'two threads inside the lock'
+    assert not conf._depths.get(target), conf._depths
+    # the file lock must be taken again by the next caller
+    import fcntl
+    with conf._locked(target):
+        with open(os.path.join(target, '__lock__'), 'a') as fp:
+            try:
+                fcntl.flock(fp, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                pass
+            else:
+                raise AssertionError('file lock not held')
+
+
+@check
+def global_without_default(folder):
+    """
+    Without a default configuration, commands use the global configuration.
+    """
+    from score.cli import conf
+    from score.cli.clibase import Configuration
+    write(folder, '.score/conf/__global__', """
+        [global]
+        key = value
+        """)
+    configuration = Configuration(None)
+    assert configuration.path == conf.global_file(create=False)
+    assert configuration.parse()['global']['key'] == 'value'
+    assert not os.path.exists(conf.default_file(create=False))
+
+
+@check
+def resident_cwd(folder):
+    """
+    Preloaded configurations referring to ``${cwd}`` are only re-used in the
+    working directory they were initialized in.
+    """
+    from score.cli.runner import Preloader
+    file = write(folder, 'cwd.conf', """
+        [score.init]
+        modules =
+
+        [x]
+        dir = ${cwd}
+        """)
+    first, second = os.path.join(folder, 'a'), os.path.join(folder, 'b')
+    os.makedirs(first)
+    os.makedirs(second)
+    cwd = os.getcwd()
+    preloader = Preloader()
+    try:
+        os.chdir(first)
+        preloader.preload(['-c', file, 'conf', 'list'])
+        resident = preloader.resident()
+        assert resident[file].load().conf['x']['dir'] == first
+        os.chdir(second)
+        assert file not in preloader.resident(), 're-used in other folder'
+    finally:
+        os.chdir(cwd)
+
+
+@check
+def indented_based_on(folder):
+    """
+    The origin of a file with a ``based_on`` key the fast path cannot read is
+    determined by a full parse.
+    """
+    from score.cli import conf
+    base = write(folder, 'base.conf', '')
+    file = write(folder, '.score/conf/__default__', """
+        [score.init]
+          based_on = %s
+        """ % base)
+    from score.init import parse_config_file
+    expected = parse_config_file(file, recurse=False)['score.init']['based_on']
+    assert conf.get_origin(file) == expected == base
+    assert conf.get_default() == 'base.conf'
+
+
+def main():
+    failed = 0
+    for func in checks:
+        with tempfile.TemporaryDirectory() as folder:
+            os.environ['HOME'] = folder
+            try:
+                func(folder)
+            except Exception as e:
+                failed += 1
+                print('%-30s FAILED: %r' % (func.__name__, e))
+            else:
+                print('%-30s ok' % func.__name__)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
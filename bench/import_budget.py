@@ -0,0 +1,105 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Verifies the import-time budget of the lightweight parts of score.cli.
+
+Each module is imported in a fresh interpreter. The check fails, if the import
+loads one of the forbidden heavy dependencies, loads more modules than its
+budget allows, or takes longer than its time budget in the best of all runs::
+
+    python bench/import_budget.py --runs 5
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+# module -> (maximum number of newly loaded modules, maximum time in ms)
+BUDGETS = {
+    'score.cli': (5, 15),
+    'score.cli.conf': (10, 20),
+}
+
+FORBIDDEN = ('click', 'score.init', 'importlib.metadata', 'pkg_resources')
+
+PROBE = '''
+import json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+import %s
+duration = time.perf_counter() - start
+print(json.dumps({
+    'modules': sorted(set(sys.modules) - before),
+    'duration': duration * 1000,
+}))
+'''
+
+
+def probe(module):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(here))
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE % module], env=env, check=True,
+        stdout=subprocess.PIPE).stdout
+    return json.loads(output.decode('UTF-8'))
+
+
+def check(module, runs):
+    max_modules, max_duration = BUDGETS[module]
+    results = [probe(module) for _ in range(runs)]
+    modules = results[0]['modules']
+    duration = min(result['duration'] for result in results)
+    errors = []
+    for name in modules:
+        if any(name == f or name.startswith(f + '.') for f in FORBIDDEN):
+            errors.append('imports %s' % name)
+    if len(modules) > max_modules:
+        errors.append('loads %d modules (budget: %d)' % (
+            len(modules), max_modules))
+    if duration > max_duration:
+        errors.append('takes %.1fms (budget: %dms)' % (
+            duration, max_duration))
+    print('%-16s %3d modules %6.1fms  %s' % (
+        module, len(modules), duration, 'FAIL' if errors else 'ok'))
+    for error in errors:
+        print('    %s' % error)
+    return not errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    results = [check(module, args.runs) for module in BUDGETS]
+    sys.exit(0 if all(results) else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Measures the cold-start time of ``python -m score.cli --help``.
+
+The command is run through ``python -c`` instead of ``-m``, since older trees
+do not provide a ``__main__`` module. Every sample is taken in a fresh
+interpreter. The command is timed once with a missing entry point index, i.e.
+the way every invocation behaved before the index existed, and once with a
+valid index. Passing ``--baseline`` with the
+path to another checkout of score.cli adds the timings of that tree for
+comparison::
+
+    python bench/startup.py --runs 20 --baseline ../score.cli-0.4.4
+"""
+
+import argparse
+import functools
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+COMMAND = 'from score.cli import main; main(prog_name="score")'
+
+
+def run(env):
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', COMMAND, '--help'], env=env,
+                   stdout=subprocess.DEVNULL, check=True)
+    return time.perf_counter() - start
+
+
+def sample(runs, env, before=None):
+    timings = []
+    for _ in range(runs):
+        if before:
+            before()
+        timings.append(run(env))
+    return timings
+
+
+def index_dropper(env):
+    """
+    Returns a function removing the entry point index of the benchmarked
+    interpreter. Its search path and possibly its ``.score`` folder differ
+    from this process', so the interpreter is asked for its index file.
+    """
+    file = subprocess.run(
+        [sys.executable, '-c', 'from score.cli.entrypoints import index_file; '
+         'print(index_file())'],
+        env=env, stdout=subprocess.PIPE, check=True,
+        universal_newlines=True).stdout.strip()
+    return functools.partial(_unlink, file)
+
+
+def _unlink(file):
+    try:
+        os.unlink(file)
+    except FileNotFoundError:
+        pass
+
+
+def report(label, timings):
+    print('%-16s min %7.1fms  median %7.1fms  max %7.1fms' % (
+        label,
+        min(timings) * 1000,
+        statistics.median(timings) * 1000,
+        max(timings) * 1000))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--baseline', metavar='PATH',
+                        help='checkout of score.cli to compare against')
+    args = parser.parse_args()
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(here))
+    report('without index', sample(args.runs, env, index_dropper(env)))
+    run(env)
+    report('with index', sample(args.runs, env))
+    if args.baseline:
+        env = dict(os.environ, PYTHONPATH=os.path.abspath(args.baseline))
+        report('baseline', sample(args.runs, env))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,122 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Runs hundreds of concurrent ``score conf add``, ``setdefault`` and ``list``
+processes against a fresh, temporary home folder and verifies that the
+configuration registry is consistent afterwards::
+
+    python bench/stress_registry.py --processes 300 --parallel 50
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+
+
+def command(folder, names):
+    name = random.choice(names)
+    operation = random.choice(('add', 'add', 'setdefault', 'list'))
+    if operation == 'add':
+        return ['conf', 'add', '--name', name,
+                os.path.join(folder, '%s.conf' % name)]
+    if operation == 'setdefault':
+        return ['conf', 'setdefault', name]
+    return ['conf', 'list']
+
+
+def run(argv, env):
+    result = subprocess.run(
+        [sys.executable, '-m', 'score.cli'] + argv, env=env,
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    # setdefault may legitimately fail, if the configuration was not added yet
+    if result.returncode and argv[1] != 'setdefault':
+        return '%s: %s' % (' '.join(argv), result.stderr.decode().strip())
+    if argv[1] == 'list':
+        for line in result.stdout.decode().splitlines():
+            if not line.split()[0].startswith('tenant'):
+                return 'list printed bogus line: %r' % line
+    return None
+
+
+def verify(home, names):
+    from score.init import parse_config_file
+    from score.cli.conf import get_origin
+    errors = []
+    folder = os.path.join(home, '.score', 'conf')
+    for file in os.listdir(folder):
+        path = os.path.join(folder, file)
+        if file.startswith('__tmp'):
+            errors.append('left-over temporary file %s' % file)
+            continue
+        if file == '__lock__':
+            continue
+        try:
+            parse_config_file(path, recurse=False)
+        except Exception as e:
+            errors.append('%s is corrupt: %s' % (file, e))
+    default = os.path.join(folder, '__default__')
+    if os.path.exists(default):
+        name = os.path.basename(get_origin(default))
+        if name not in os.listdir(folder):
+            errors.append('default points to missing %s' % name)
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--processes', type=int, default=200)
+    parser.add_argument('--parallel', type=int, default=32)
+    parser.add_argument('--names', type=int, default=10)
+    args = parser.parse_args()
+    names = ['tenant%d' % i for i in range(args.names)]
+    with tempfile.TemporaryDirectory() as home:
+        for name in names:
+            with open(os.path.join(home, '%s.conf' % name), 'w') as fp:
+                fp.write('[%s]\nkey = value\n' % name)
+        env = dict(os.environ, HOME=home, PYTHONPATH=os.path.dirname(here))
+        env.pop('VIRTUAL_ENV', None)
+        commands = [command(home, names) for _ in range(args.processes)]
+        with ThreadPoolExecutor(args.parallel) as executor:
+            errors = [e for e in executor.map(lambda c: run(c, env), commands)
+                      if e]
+        os.environ['HOME'] = home
+        errors += verify(home, names)
+    for error in errors:
+        print(error)
+    print('%d processes, %d errors' % (args.processes, len(errors)))
+    sys.exit(1 if errors else 0)
+
+
+if __name__ == '__main__':
+    main()
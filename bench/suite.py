@@ -0,0 +1,259 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Benchmarks of the score CLI's hot paths.
+
+All benchmarks run offline: plugins are provided by generated fake
+distributions and configurations are generated in temporary folders. The
+``.score`` folder is redirected to a temporary folder, too, so the benchmarks
+never touch the real configuration, even inside a virtual environment. Only
+the ``score --help`` benchmark runs in separate interpreters, which use the
+entry point index of the virtual environment in that case::
+
+    python bench/suite.py
+    python bench/suite.py --only plugins --only parse
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import textwrap
+import time
+
+here = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(here))
+sys.path.insert(0, here)
+
+import click  # noqa: E402
+from click.testing import CliRunner  # noqa: E402
+from score.init import parse_config_file  # noqa: E402
+
+import startup  # noqa: E402
+from score.cli import cli, conf as score_conf, entrypoints  # noqa: E402
+from score.cli.clibase import Configuration, ScoreCLI  # noqa: E402
+from score.cli.conf import get_file, name2file  # noqa: E402
+from score.cli.parsecache import ParseCache  # noqa: E402
+
+
+def timed(func, *, runs=20, setup=None):
+    """
+    Calls *func* *runs* times and returns the median duration in
+    milliseconds. The optional *setup* is called before every run without
+    being timed.
+    """
+    timings = []
+    for _ in range(runs):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings) * 1000
+
+
+def isolate(home):
+    """
+    Redirects the ``.score`` folder of this process to given *home* folder.
+    Changing :envvar:`HOME` alone is not sufficient inside a virtual
+    environment, which has a ``.score`` folder of its own.
+    """
+    os.environ['HOME'] = home
+    score_conf.venv_root = lambda venv=None: venv
+
+
+def report(name, **timings):
+    print('%-28s %s' % (name, '  '.join(
+        '%s %8.2fms' % (key, value) for key, value in timings.items())))
+
+
+def make_plugins(folder, count):
+    """
+    Generates a fake distribution providing *count* ``score.cli`` entry
+    points in given *folder*.
+    """
+    package = os.path.join(folder, 'fakeplugins')
+    os.makedirs(package)
+    open(os.path.join(package, '__init__.py'), 'w').close()
+    with open(os.path.join(package, 'commands.py'), 'w') as fp:
+        fp.write('import click\n')
+        for i in range(count):
+            fp.write(textwrap.dedent('''
+                @click.command()
+                def cmd%d():
+                    """Fake command number %d."""
+            ''' % (i, i)))
+    metadir = os.path.join(folder, 'fakeplugins-1.0.dist-info')
+    os.makedirs(metadir)
+    with open(os.path.join(metadir, 'METADATA'), 'w') as fp:
+        fp.write('Metadata-Version: 2.1\nName: fakeplugins\nVersion: 1.0\n')
+    with open(os.path.join(metadir, 'entry_points.txt'), 'w') as fp:
+        fp.write('[score.cli]\n')
+        for i in range(count):
+            fp.write('fake%d = fakeplugins.commands:cmd%d\n' % (i, i))
+
+
+def bench_help(args):
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(here))
+    cold = statistics.median(
+        startup.sample(args.runs, env, startup.index_dropper(env))) * 1000
+    startup.run(env)
+    warm = statistics.median(startup.sample(args.runs, env)) * 1000
+    report('score --help', cold=cold, warm=warm)
+
+
+def bench_plugins(args):
+    group = ScoreCLI()
+    for count in (10, 100, 1000):
+        with tempfile.TemporaryDirectory() as folder:
+            make_plugins(folder, count)
+            sys.path.insert(0, folder)
+            try:
+                ctx = click.Context(group)
+
+                def scan():
+                    entrypoints.commands(refresh=True)
+
+                def reset():
+                    entrypoints._index = None
+                scan_ms = timed(scan, runs=args.runs)
+                list_ms = timed(lambda: group.list_commands(ctx),
+                                runs=args.runs, setup=reset)
+                get_ms = timed(lambda: group.get_command(ctx, 'fake1'),
+                               runs=args.runs, setup=reset)
+            finally:
+                sys.path.remove(folder)
+                sys.modules.pop('fakeplugins.commands', None)
+                sys.modules.pop('fakeplugins', None)
+        report('plugins (%d)' % count,
+               scan=scan_ms, list=list_ms, get=get_ms)
+
+
+def bench_conf(args):
+    for count in (10, 100, 1000):
+        with tempfile.TemporaryDirectory() as folder:
+            conf = os.path.join(folder, '.score', 'conf')
+            os.makedirs(conf)
+            for i in range(count):
+                with open(os.path.join(conf, 'tenant-%05d' % i), 'w') as fp:
+                    fp.write('[score.init]\nbased_on =\n    %s/%d.conf\n' % (
+                        folder, i))
+            isolate(folder)
+            name = 'tenant-%05d' % (count // 2)
+            runner = CliRunner()
+            report(
+                'conf (%d)' % count,
+                name2file=timed(name2file, runs=args.runs),
+                get_file=timed(lambda: get_file(name), runs=args.runs),
+                list=timed(lambda: runner.invoke(cli.main, ['list']),
+                           runs=args.runs),
+                paths=timed(lambda: runner.invoke(cli.main, ['list', '-p']),
+                            runs=args.runs))
+
+
+def bench_parse(args):
+    for depth in (2, 10, 50):
+        with tempfile.TemporaryDirectory() as folder:
+            for i in range(depth):
+                with open(os.path.join(folder, '%d.conf' % i), 'w') as fp:
+                    if i:
+                        fp.write('[score.init]\nbased_on = %d.conf\n' % (
+                            i - 1))
+                    fp.write('[section%d]\nkey = value %d\n' % (i, i))
+            file = os.path.join(folder, '%d.conf' % (depth - 1))
+            configuration = Configuration(file)
+            # the second parse re-uses the result of the first one
+            configuration.parse()
+            configuration.parse()
+            snapshot = os.path.join(folder, 'compiled')
+            ParseCache(snapshot).compile(file)
+
+            # a new cache object behaves like the cache of a new process
+            def miss():
+                ParseCache(readonly=True).parse(file)
+
+            def compiled():
+                ParseCache(snapshot, readonly=True).parse(file)
+            report('parse (depth %d)' % depth,
+                   uncached=timed(lambda: parse_config_file(file),
+                                  runs=args.runs),
+                   miss=timed(miss, runs=args.runs),
+                   compiled=timed(compiled, runs=args.runs),
+                   cached=timed(configuration.parse, runs=args.runs))
+
+
+def bench_dump(args):
+    for sections in (10, 100, 1000):
+        with tempfile.TemporaryDirectory() as folder:
+            file = os.path.join(folder, 'large.conf')
+            with open(file, 'w') as fp:
+                for i in range(sections):
+                    fp.write('[section%d]\n' % i)
+                    for j in range(10):
+                        fp.write('key%d = value %d\n    continued\n' % (j, j))
+            runner = CliRunner()
+            obj = {'conf': Configuration(file)}
+
+            def forget():
+                Configuration.parse_cache.invalidate(file)
+            report('conf dump (%d sections)' % sections,
+                   cold=timed(lambda: runner.invoke(cli.main, ['dump'],
+                                                    obj=obj),
+                              runs=args.runs, setup=forget),
+                   all=timed(lambda: runner.invoke(cli.main, ['dump'],
+                                                   obj=obj),
+                             runs=args.runs),
+                   one=timed(lambda: runner.invoke(cli.main,
+                                                   ['dump', 'section1'],
+                                                   obj=obj),
+                             runs=args.runs))
+
+
+BENCHMARKS = {
+    'help': bench_help,
+    'plugins': bench_plugins,
+    'conf': bench_conf,
+    'parse': bench_parse,
+    'dump': bench_dump,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--only', action='append', choices=BENCHMARKS)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as home:
+        isolate(home)
+        for name in args.only or BENCHMARKS:
+            BENCHMARKS[name](args)
+            isolate(home)
+
+
+if __name__ == '__main__':
+    main()
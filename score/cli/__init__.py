@@ -24,12 +24,24 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district
 # the Licensee has his registered seat, an establishment or assets.
 
-from .clibase import ScoreCLI, main, init_score
-
-
 __all__ = ('ScoreCLI', 'main', 'init_score')
 
 __version__ = '0.4.4'
 
+
+def __getattr__(name):
+    # clibase pulls in click and score.init, which is a waste of time for
+    # code that just wants to use the helpers in score.cli.conf
+    if name in __all__:
+        from . import clibase
+        return getattr(clibase, name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
+
+
+def __dir__():
+    return sorted(list(globals()) + list(__all__))
+
+
 if __name__ == '__main__':
+    from .clibase import main
     main()
@@ -0,0 +1,74 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import shlex
+
+import click
+
+
+def read_commands(file):
+    """
+    Reads ``score`` command lines from given *file* object. Empty lines and
+    lines starting with a hash are skipped, the leading word ``score`` is
+    optional. Returns a list of tuples containing the line and the parsed
+    argument list.
+    """
+    commands = []
+    for line in file:
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        argv = shlex.split(line)
+        if argv[0] == 'score':
+            argv = argv[1:]
+        commands.append((line, argv))
+    return commands
+
+
+@click.command('batch')
+@click.argument('file', type=click.File('r'), default='-')
+@click.option('-j', '--jobs', type=int,
+              help='Number of commands to run in parallel.')
+def main(file, jobs=None):
+    """
+    Runs a list of commands in parallel.
+    """
+    from .runner import Preloader
+    commands = read_commands(file)
+    argvs = [argv for _, argv in commands]
+    failed = 0
+    for index, code, output in Preloader().run_parallel(argvs, jobs=jobs):
+        click.echo('==> %s (exit code %d)' % (commands[index][0], code))
+        click.echo(output, nl=False)
+        if code:
+            failed += 1
+    if failed:
+        raise click.ClickException(
+            '%d of %d commands failed' % (failed, len(commands)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+An in-memory index of the configuration folders for long-running processes.
+"""
+
+import errno
+import os
+import select
+import struct
+import threading
+from collections import OrderedDict
+
+from . import conf
+
+
+class ConfCatalog:
+    """
+    Keeps track of the configurations in the global and the virtual
+    environment's configuration folders and provides the same lookups as the
+    functions in :mod:`score.cli.conf`, without touching the file system on
+    every call.
+
+    The index is updated in a background thread, which receives change
+    notifications via inotify on Linux. Other platforms, and folders that do
+    not exist yet, are polled every *interval* seconds. Passing a falsy value
+    for *watch* disables the thread altogether, the index must then be updated
+    by calling :meth:`.refresh` manually.
+
+    The *include_global* and *venv* parameters have the same meaning as in
+    :func:`score.cli.conf.name2file`. Instances should be :meth:`closed
+    <.close>` when no longer needed, they can also be used as context
+    managers::
+
+        with ConfCatalog() as catalog:
+            file = catalog.get_file(catalog.get_default())
+    """
+
+    def __init__(self, *, include_global=True, venv=None, interval=1.0,
+                 watch=True):
+        self.folders = conf._conf_folders(
+            include_global=include_global, venv=venv)
+        self.default_file = conf.default_file(venv=venv, create=False)
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._contents = dict((folder, {}) for folder in self.folders)
+        self._stats = dict.fromkeys(self.folders)
+        self._names = OrderedDict()
+        self._origins = {}
+        self._default = _unknown
+        self._inotify = None
+        self._watches = {}
+        self._thread = None
+        self._stop = None
+        if watch:
+            self._inotify = _Inotify.create()
+        for folder in self.folders:
+            self._scan(folder)
+        self._rebuild()
+        if watch:
+            self._stop = os.pipe()
+            self._thread = threading.Thread(
+                target=self._run, name='score.cli.ConfCatalog', daemon=True)
+            self._thread.start()
+
+    @property
+    def watching(self):
+        """
+        Whether changes are detected via inotify instead of polling.
+        """
+        return self._inotify is not None
+
+    def name2file(self):
+        """
+        Returns the names of all available configurations, just like
+        :func:`score.cli.conf.name2file`.
+        """
+        return OrderedDict(self._names)
+
+    def get_file(self, name):
+        """
+        Returns the file the configuration with given *name* is pointing to.
+        Raises a `KeyError` if there is no such configuration.
+        """
+        return self._names[name]
+
+    def get_default(self):
+        """
+        Returns the name of the default configuration, or `None`.
+        """
+        default = self._default
+        if default is _unknown:
+            with self._lock:
+                try:
+                    default = os.path.basename(
+                        conf.get_origin(self.default_file))
+                except FileNotFoundError:
+                    default = None
+                self._default = default
+        return default
+
+    def get_origin(self, file):
+        """
+        Returns the file given configuration *file* is based on, just like
+        :func:`score.cli.conf.get_origin`. Results for files inside the
+        observed folders are cached until the file changes.
+        """
+        # the lock keeps the watcher from invalidating the result while it
+        # is being read, which would cache an outdated value
+        with self._lock:
+            try:
+                return self._origins[file]
+            except KeyError:
+                pass
+            base = conf.get_origin(file)
+            if os.path.dirname(file) in self._contents:
+                self._origins[file] = base
+            return base
+
+    def refresh(self):
+        """
+        Re-reads all observed folders.
+        """
+        with self._lock:
+            for folder in self.folders:
+                self._scan(folder)
+            self._origins.clear()
+            self._default = _unknown
+            self._rebuild()
+
+    def close(self):
+        """
+        Stops the background thread and releases all resources.
+        """
+        if self._thread is not None:
+            os.write(self._stop[1], b'\0')
+            self._thread.join()
+            self._thread = None
+            for fd in self._stop:
+                os.close(fd)
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def _scan(self, folder):
+        """
+        Reads the contents of given *folder*, registering an inotify watch
+        first, so no change can get lost between the listing and the watch.
+        """
+        if self._inotify is not None and folder not in self._watches.values():
+            try:
+                wd = self._inotify.add_watch(folder)
+            except OSError:
+                pass
+            else:
+                self._watches[wd] = folder
+        try:
+            self._stats[folder] = _stat(folder)
+            names = os.listdir(folder)
+        except OSError:
+            self._stats[folder] = None
+            names = []
+        self._contents[folder] = dict(
+            (name, os.path.join(folder, name))
+            for name in names if not name.startswith('__'))
+
+    def _rebuild(self):
+        files = {}
+        for folder in self.folders:
+            files.update(self._contents[folder])
+        self._names = OrderedDict(
+            (name, files[name]) for name in sorted(files))
+
+    def _changed(self, folder, name):
+        """
+        Updates the index after the entry *name* in *folder* was modified.
+        """
+        file = os.path.join(folder, name)
+        self._origins.pop(file, None)
+        if file == self.default_file:
+            self._default = _unknown
+        if name.startswith('__'):
+            return
+        if os.path.lexists(file):
+            self._contents[folder][name] = file
+        else:
+            self._contents[folder].pop(name, None)
+        self._rebuild()
+
+    def _poll(self):
+        """
+        Re-reads all folders, which are not watched by inotify and were
+        modified since the last check.
+        """
+        watched = set(self._watches.values())
+        for folder in self.folders:
+            if folder in watched:
+                continue
+            stat = _stat(folder)
+            if stat is not None and stat == self._stats[folder]:
+                continue
+            if stat is None and self._stats[folder] is None:
+                continue
+            self._scan(folder)
+            for file in list(self._origins):
+                if os.path.dirname(file) == folder:
+                    del self._origins[file]
+            if os.path.dirname(self.default_file) == folder:
+                self._default = _unknown
+            self._rebuild()
+
+    def _run(self):
+        fds = [self._stop[0]]
+        if self._inotify is not None:
+            fds.append(self._inotify.fd)
+        while True:
+            try:
+                readable = select.select(fds, [], [], self.interval)[0]
+            except InterruptedError:
+                continue
+            if self._stop[0] in readable:
+                return
+            with self._lock:
+                if self._inotify is not None and self._inotify.fd in readable:
+                    self._handle(self._inotify.read())
+                self._poll()
+
+    def _handle(self, events):
+        for wd, mask, name in events:
+            if mask & _Inotify.IN_Q_OVERFLOW:
+                self.refresh()
+                continue
+            folder = self._watches.get(wd)
+            if folder is None:
+                continue
+            if mask & (_Inotify.IN_IGNORED | _Inotify.IN_DELETE_SELF |
+                       _Inotify.IN_MOVE_SELF):
+                # the folder itself is gone, fall back to polling until it
+                # reappears
+                del self._watches[wd]
+                if not mask & _Inotify.IN_IGNORED:
+                    self._inotify.rm_watch(wd)
+                self._contents[folder] = {}
+                self._stats[folder] = None
+                self._rebuild()
+                continue
+            if name:
+                self._changed(folder, name)
+
+
+class _Unknown:
+
+    def __repr__(self):
+        return '<unknown>'
+
+
+_unknown = _Unknown()
+
+
+def _stat(folder):
+    try:
+        stat = os.stat(folder)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino)
+
+
+class _Inotify:
+    """
+    A minimal wrapper around the inotify API of the Linux kernel.
+    """
+
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    IN_ONLYDIR = 0x01000000
+
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+
+    MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM |
+            IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF |
+            IN_MOVE_SELF | IN_ONLYDIR)
+
+    _header = struct.Struct('iIII')
+
+    @classmethod
+    def create(cls):
+        """
+        Returns a new instance, or `None` if inotify is not available.
+        """
+        try:
+            import ctypes
+            import ctypes.util
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            init = libc.inotify_init1
+        except (ImportError, OSError, AttributeError):
+            return None
+        fd = init(cls.IN_NONBLOCK | cls.IN_CLOEXEC)
+        if fd < 0:
+            return None
+        return cls(libc, fd)
+
+    def __init__(self, libc, fd):
+        self.libc = libc
+        self.fd = fd
+
+    def add_watch(self, folder):
+        wd = self.libc.inotify_add_watch(
+            self.fd, os.fsencode(folder), self.MASK)
+        if wd < 0:
+            import ctypes
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error), folder)
+        return wd
+
+    def rm_watch(self, wd):
+        self.libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self):
+        """
+        Returns a list of pending events as tuples of watch descriptor, event
+        mask and file name.
+        """
+        try:
+            data = os.read(self.fd, 65536)
+        except OSError as e:
+            if e.errno in (errno.EAGAIN, errno.EINTR):
+                return []
+            raise
+        events = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = self._header.unpack_from(data, offset)
+            offset += self._header.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            events.append((wd, mask, os.fsdecode(name)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
@@ -26,10 +26,14 @@
 
 import click
 from .conf import (
-    name2file, add, remove, get_file, get_default, make_default, get_origin)
+    name2file, add_many, remove_many, get_file, get_default, make_default,
+    get_origin, InvalidConfigurationNameException)
+import glob
+import json
 import os
 import re
-from score.init import parse_config_file as parse
+import shlex
+from collections import OrderedDict
 
 
 def name_from_file(file):
@@ -63,30 +67,93 @@ def conf_list(paths):
         print(tpl.format(
             name=conf,
             default='*' if conf == default else ' ',
-            path=get_origin(path),
+            path=get_origin(path) if paths else None,
         ))
 
 
 @main.command('add')
-@click.argument('file')
+@click.argument('files', nargs=-1)
 @click.option('-n', '--name', 'name')
 @click.option('-d', '--make-default', 'make_default_',
               is_flag=True, default=False)
-def conf_add(file, name=None, make_default_=False):
+@click.option('-m', '--from-manifest', 'manifest', type=click.File('r'),
+              help='A file containing lines of the form `name = path\'.')
+@click.option('--default', 'default',
+              help='The name of the added configuration to make default.')
+def conf_add(files, name=None, make_default_=False, manifest=None,
+             default=None):
     """
-    Adds a new configuration.
+    Adds new configurations.
+
+    Accepts any number of files and glob patterns.
     """
-    file = os.path.abspath(file)
-    if name is None:
-        name = name_from_file(file)
-    make_default_ = make_default_ or not name2file()
-    if not os.path.exists(file):
-        raise click.UsageError('File does not exist')
-    if not os.path.isfile(file):
-        raise click.UsageError('Path is not a file')
-    add(name, file)
+    paths = []
+    for pattern in files:
+        if not any(char in pattern for char in '*?['):
+            paths.append(pattern)
+            continue
+        matches = sorted(glob.glob(pattern))
+        if not matches:
+            raise click.UsageError('No files matching %s' % pattern)
+        paths.extend(matches)
+    if name is not None and (len(paths) != 1 or manifest):
+        raise click.UsageError('--name requires exactly one file')
+    configurations = OrderedDict()
+    for path in paths:
+        path = os.path.abspath(path)
+        _add_configuration(configurations, name or name_from_file(path), path)
+    if manifest:
+        for name, path in read_manifest(manifest):
+            _add_configuration(configurations, name, path)
+    if not configurations:
+        raise click.UsageError('No configuration files given')
+    for path in configurations.values():
+        if not os.path.exists(path):
+            raise click.UsageError('File does not exist: %s' % path)
+        if not os.path.isfile(path):
+            raise click.UsageError('Path is not a file: %s' % path)
     if make_default_:
-        make_default(name)
+        if len(configurations) > 1:
+            raise click.UsageError(
+                '--make-default requires exactly one configuration, '
+                'use --default to select one of multiple configurations')
+        default = next(iter(configurations))
+    if default is not None and default not in configurations:
+        raise click.UsageError('--default must name an added configuration')
+    if default is None and not name2file():
+        default = next(iter(configurations))
+    try:
+        add_many(configurations)
+    except InvalidConfigurationNameException as e:
+        raise click.UsageError('Invalid configuration name: %s' % e)
+    if default is not None:
+        make_default(default)
+
+
+def _add_configuration(configurations, name, path):
+    if name in configurations:
+        raise click.UsageError('Configuration `%s\' given twice' % name)
+    configurations[name] = path
+
+
+def read_manifest(file):
+    """
+    Reads configuration names and paths from given manifest *file* object.
+    Each line of the file consists of a name and a path separated by an equals
+    sign, empty lines and lines starting with a hash are ignored. Relative
+    paths are relative to the folder containing the manifest.
+    """
+    folder = os.path.dirname(os.path.abspath(getattr(file, 'name', '.')))
+    for number, line in enumerate(file, 1):
+        line = line.strip()
+        if not line or line.startswith('#'):
+            continue
+        if '=' not in line:
+            raise click.UsageError(
+                'Invalid manifest line %d: %s' % (number, line))
+        name, path = (part.strip() for part in line.split('=', 1))
+        yield name, os.path.abspath(
+            os.path.join(folder, os.path.expanduser(path)))
 
 
 @main.command('setdefault')
@@ -98,76 +165,150 @@ def setdefault(name):
     make_default(name)
 
 
-CONFIRM_DELETE = 'Delete default configuration `%s\'?'
+CONFIRM_DELETE = 'WARNING: `%s\' is the default configuration!'
 CONFIRM_DELETE_WRONG_PATH = \
-    'WARNING: Path mismatch!\n' \
+    'WARNING: Path mismatch for configuration `{name}\'!\n' \
     ' Configured file: {real}\n' \
-    ' You provided:    {provided})\n'\
-    '\n' \
-    'Proceed anyway and delete configuration `{name}\'? '
+    ' You provided:    {provided}'
 
 
 @main.command('rm')
 @click.argument('name', nargs=-1)
-def remove_(name):
+@click.option('-y', '--yes', is_flag=True, default=False,
+              help='Do not ask for confirmation.')
+@click.option('-n', '--dry-run', 'dry_run', is_flag=True, default=False,
+              help='Only print the configurations that would be removed.')
+def remove_(name, yes=False, dry_run=False):
     """
-    Removes a configuration.
+    Removes configurations.
+
+    Accepts configuration names as well as paths to configured files.
     """
     names = name
+    catalog = name2file()
+    default = get_default()
+    targets = OrderedDict()
+    warnings = []
     for name in names:
         if re.match('^[a-zA-Z0-9_-]+$', name):
-            if name == get_default():
-                click.confirm(CONFIRM_DELETE % name, abort=True)
-            remove(name)
+            if name not in catalog:
+                click.echo('No such configuration: %s' % name, err=True)
+                continue
+            targets[name] = catalog[name]
             continue
         # assume *name* is actually the path to a file
-        file = name
-        file = os.path.realpath(file)
+        file = os.path.realpath(name)
         name = name_from_file(file)
-        conf = get_file(name)
+        if name not in catalog:
+            click.echo('No configuration for file: %s' % file, err=True)
+            continue
         try:
-            parsedconf = parse(conf, recurse=False)
-        except FileNotFoundError:
-            pass
-        else:
-            configured = parsedconf['score.init']['based_on']
-            if file != configured:
-                confirmed = click.confirm(CONFIRM_DELETE_WRONG_PATH.format(
-                    name=name,
-                    real=configured,
-                    provided=file,
-                ))
-                if not confirmed:
-                    continue
-        remove(name)
+            configured = get_origin(catalog[name])
+        except (OSError, KeyError):
+            configured = None
+        if configured and os.path.realpath(configured) != file:
+            warnings.append(CONFIRM_DELETE_WRONG_PATH.format(
+                name=name,
+                real=configured,
+                provided=file,
+            ))
+        targets[name] = catalog[name]
+    if default in targets:
+        warnings.append(CONFIRM_DELETE % default)
+    if dry_run:
+        for message in warnings:
+            click.echo(message, err=True)
+        for name, file in targets.items():
+            click.echo('Would remove %s (%s)' % (name, file))
+        return
+    if warnings and not yes:
+        click.confirm('\n'.join(warnings) + '\n\nProceed and delete %d '
+                      'configuration(s)?' % len(targets), abort=True)
+    remove_many(targets)
+
+
+@main.command('compile')
+@click.argument('name', required=False)
+@click.pass_context
+def compile_(clickctx, name=None):
+    """
+    Stores a pre-parsed snapshot of a configuration.
+    """
+    from .clibase import Configuration
+    if name is None:
+        file = clickctx.obj['conf'].path
+    elif os.path.isfile(name):
+        file = name
+    else:
+        try:
+            file = get_file(name)
+        except KeyError:
+            raise click.UsageError('Configuration `%s\' not found' % name)
+    cache = Configuration.parse_cache
+    files = cache.compile(file)
+    # the snapshot is also checked against the files matching these patterns
+    patterns = cache.includes(file)
+    for file in files + patterns:
+        click.echo(file)
+
+
+DUMP_FORMATS = ('ini', 'json', 'env')
 
 
 @main.command('dump')
 @click.argument('sections', nargs=-1)
+@click.option('-f', '--format', 'format_', type=click.Choice(DUMP_FORMATS),
+              default='ini', help='The output format.')
 @click.pass_context
-def dump(clickctx, sections):
+def dump(clickctx, sections, format_='ini'):
     """
     Prints the current configuration.
     """
     confdict = clickctx.obj['conf'].parse()
-    for section in confdict:
+    defaults = confdict.get('DEFAULT', {})
+    if sections:
+        names = [s for s in OrderedDict.fromkeys(sections) if s in confdict]
+    else:
+        names = list(confdict)
+    result = OrderedDict()
+    for section in names:
         if section == 'DEFAULT':
             continue
-        if sections and section not in sections:
-            continue
-        print('[%s]' % section)
-        for key in confdict[section]:
-            value = confdict[section][key]
-            is_default = (
-                'DEFAULT' in confdict and
-                key in confdict['DEFAULT'] and
-                confdict['DEFAULT'][key] == value)
-            if is_default:
-                continue
+        result[section] = OrderedDict(
+            (key, value) for key, value in confdict[section].items()
+            if key not in defaults or defaults[key] != value)
+    output = click.get_text_stream('stdout')
+    output.write(''.join(_dump_formatters[format_](result)))
+    output.flush()
+
+
+def _dump_ini(confdict):
+    for section, values in confdict.items():
+        yield '[%s]\n' % section
+        for key, value in values.items():
             if '\n' in value and value[0] != '\n':
                 value = '\n' + value
-            print('%s = %s' % (key, value.replace('\n', '\n    ')))
-        print('')
+            yield '%s = %s\n' % (key, value.replace('\n', '\n    '))
+        yield '\n'
+
+
+def _dump_json(confdict):
+    yield json.dumps(confdict, indent=2)
+    yield '\n'
+
+
+def _dump_env(confdict):
+    for section, values in confdict.items():
+        for key, value in values.items():
+            name = re.sub('[^A-Za-z0-9]', '_', '%s__%s' % (section, key))
+            yield '%s=%s\n' % (name.upper(), shlex.quote(value))
+
+
+_dump_formatters = {
+    'ini': _dump_ini,
+    'json': _dump_json,
+    'env': _dump_env,
+}
 
 
 if __name__ == '__main__':
@@ -24,15 +24,28 @@
 # the discretion of STRG.AT GmbH also the competent court, in whose district
 # the Licensee has his registered seat, an establishment or assets.
 
+# the profile module needs to be imported first to be able to time the
+# imports of all other modules
+from . import profile
+
 import logging
 import functools
-from pkg_resources import iter_entry_points
+import hashlib
+import importlib
+import inspect
+import json
 import os
+import sys
+from collections import OrderedDict
 
 import click
-from score.init import init_from_file, parse_config_file
+from score.init import init, parse_list
 
-from .conf import default_file, get_file
+from . import entrypoints, metrics
+from .plugins import manifest_error
+from .conf import (
+    default_file, get_default, get_file, global_file, name2file)
+from .parsecache import ParseCache, compiled_folder
 
 
 class ScoreCLI(click.MultiCommand):
@@ -40,15 +53,84 @@ class ScoreCLI(click.MultiCommand):
     Master command loading sub-commands from plugins.
     """
 
+    def main(self, args=None, prog_name=None, **extra):
+        collector = None
+        status = 1
+        try:
+            daemon = os.getenv('SCORE_CLI_DAEMON')
+            if daemon and extra.get('standalone_mode', True):
+                argv = sys.argv[1:] if args is None else list(args)
+                if argv[:1] != ['daemon']:
+                    from .daemon import forward
+                    code = forward(
+                        argv, path=None if daemon == '1' else daemon)
+                    if code is not None:
+                        sys.exit(code)
+            # forwarded commands are recorded by the daemon
+            collector = metrics.start()
+            result = click.MultiCommand.main(self, args, prog_name, **extra)
+            status = 0
+            return result
+        except SystemExit as e:
+            status = _exit_status(e.code)
+            raise
+        finally:
+            if collector is not None:
+                metrics.stop(status)
+            recorder = profile.disable()
+            if recorder is not None:
+                recorder.write()
+
+    def invoke(self, ctx):
+        configurations = ctx.params.get('conf') or ()
+        collector = metrics.current()
+        if collector is not None:
+            collector.configuration = ','.join(
+                name for name, file in configurations) or get_default()
+            if len(configurations) > 1:
+                collector.command = ' '.join(
+                    [ctx.command_path] + ctx.protected_args[:1])
+        if len(configurations) > 1 and (ctx.protected_args or ctx.args):
+            return self._invoke_many(ctx, configurations)
+        return click.MultiCommand.invoke(self, ctx)
+
+    def _invoke_many(self, ctx, configurations):
+        """
+        Runs the sub-command once for each of the given *configurations* in
+        parallel child processes and prints their output, prefixed with the
+        name of the configuration.
+        """
+        from .runner import Preloader
+        args = ctx.protected_args + ctx.args
+        options = []
+        if ctx.params.get('max_workers') is not None:
+            options += ['--max-workers', str(ctx.params['max_workers'])]
+        # import the plugin once, so all child processes can share it
+        command = self.get_command(ctx, args[0])
+        if isinstance(command, LazyCommand):
+            command.command
+        commands = [['-c', file] + options + args
+                    for name, file in configurations]
+        failed = []
+        preloader = Preloader()
+        results = preloader.run_parallel(
+            commands, jobs=ctx.params.get('jobs'), preload=False)
+        for index, code, output in results:
+            name = configurations[index][0]
+            for line in output.decode('UTF-8', 'replace').splitlines():
+                click.echo('[%s] %s' % (name, line))
+            if code:
+                failed.append(name)
+                click.echo('[%s] exit code %d' % (name, code), err=True)
+        if failed:
+            raise click.ClickException('%d of %d configurations failed: %s' % (
+                len(failed), len(configurations), ', '.join(sorted(failed))))
+
     def list_commands(self, ctx):
-        result = []
-        for entrypoint in iter_entry_points(group='score.cli'):
-            result.append(entrypoint.name)
-        result.sort()
-        return result
+        return sorted(entrypoints.commands())
 
     def get_command(self, ctx, name):
-        plugins = list(iter_entry_points(group='score.cli', name=name))
+        plugins = entrypoints.commands().get(name, [])
         if len(plugins) == 0:
             message = 'Entry point "%s" not found' % name
             raise click.ClickException(message)
@@ -57,54 +139,600 @@ class ScoreCLI(click.MultiCommand):
             for plugin in plugins:
                 message += '\n - %s' % plugin.dist
             raise click.ClickException(message)
-        return plugins[0].load()
+        summary = entrypoints.summary(name)
+
+        def load():
+            try:
+                command = plugins[0].load()
+            except Exception:
+                error = manifest_error(name)
+                if error is not None:
+                    click.echo(
+                        'Command "%s" also failed to load during `score '
+                        'plugins warm\': %s' % (name, error), err=True)
+                raise
+            return _wrap_callbacks(command)
+        if summary is not None:
+            return LazyCommand(name, load, summary)
+        command = load()
+        entrypoints.store_summary(name, command)
+        return command
+
+
+class LazyCommand(click.Command):
+    """
+    Stand-in for a plugin's :class:`click.Command`, which can render the
+    command's short help without importing the plugin. The real command is
+    loaded through the given *loader* as soon as the command is invoked or
+    its own help page is requested.
+    """
+
+    def __init__(self, name, loader, summary):
+        click.Command.__init__(self, name)
+        self.help = summary['help']
+        self.short_help = summary['short_help']
+        self.hidden = summary['hidden']
+        self._loader = loader
+        self._command = None
+
+    @property
+    def command(self):
+        """
+        The actual :class:`click.Command`.
+        """
+        if self._command is None:
+            self._command = self._loader()
+        return self._command
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        return self.command.make_context(
+            info_name, args, parent=parent, **extra)
+
+    def invoke(self, ctx):
+        return self.command.invoke(ctx)
+
+    def get_help(self, ctx):
+        return self.command.get_help(ctx)
+
+    def shell_complete(self, ctx, incomplete):
+        return self.command.shell_complete(ctx, incomplete)
+
+
+class ContextObject(dict):
+    """
+    The object available as :attr:`click.Context.obj` in all commands. Apart
+    from the ``conf`` and ``log`` values, it provides the following values,
+    which are created on first access:
+
+    ``executor``
+        A :class:`concurrent.futures.ThreadPoolExecutor` shared by all code
+        running in this process. Its size can be configured with the
+        ``--max-workers`` option of the ``score`` command.
+
+    ``loop``
+        The :mod:`asyncio` event loop running coroutine commands. The executor
+        above is its default executor.
+
+    Both are shut down when the ``score`` command finishes.
+    """
+
+    def __missing__(self, key):
+        if key == 'executor':
+            from concurrent.futures import ThreadPoolExecutor
+            value = ThreadPoolExecutor(max_workers=self.get('max_workers'),
+                                       thread_name_prefix='score.cli')
+        elif key == 'loop':
+            import asyncio
+            value = asyncio.new_event_loop()
+            value.set_default_executor(self['executor'])
+            asyncio.set_event_loop(value)
+        else:
+            raise KeyError(key)
+        self[key] = value
+        return value
+
+    def close(self):
+        """
+        Cancels all remaining tasks of the event loop and releases the loop and
+        the executor.
+        """
+        loop = self.pop('loop', None)
+        if loop is not None:
+            import asyncio
+            try:
+                tasks = asyncio.all_tasks(loop)
+                for task in tasks:
+                    task.cancel()
+                if tasks:
+                    loop.run_until_complete(asyncio.gather(
+                        *tasks, return_exceptions=True))
+                loop.run_until_complete(loop.shutdown_asyncgens())
+            finally:
+                asyncio.set_event_loop(None)
+                loop.close()
+        executor = self.pop('executor', None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+
+def run_coroutine(ctx, coroutine):
+    """
+    Runs given *coroutine* to completion on the event loop managed by the
+    given click context *ctx* and returns its result.
+    """
+    if not isinstance(ctx.obj, ContextObject):
+        # the command was invoked without the `score' command
+        import asyncio
+        return asyncio.run(coroutine)
+    return ctx.obj['loop'].run_until_complete(coroutine)
+
+
+def _wrap_callbacks(command):
+    """
+    Replaces the callbacks of given :class:`click.Command` and all its
+    sub-commands with functions timing them as the ``command`` :func:`phase
+    <score.cli.profile.phase>` and running the coroutines they return through
+    :func:`.run_coroutine`.
+    """
+    callback = getattr(command, 'callback', None)
+    if callback and not getattr(callback, 'wrapped_by_score', False):
+        # decorators like click.pass_context turn coroutine functions into
+        # regular functions returning a coroutine, which is why the result
+        # is inspected instead of the callback
+        @functools.wraps(callback)
+        def wrapped(*args, **kwargs):
+            ctx = click.get_current_context()
+            with profile.phase('command', ctx.command_path):
+                result = callback(*args, **kwargs)
+                if inspect.iscoroutine(result):
+                    result = run_coroutine(ctx, result)
+            return result
+        wrapped.wrapped_by_score = True
+        command.callback = wrapped
+    for subcommand in getattr(command, 'commands', {}).values():
+        _wrap_callbacks(subcommand)
+    return command
 
 
 class Configuration:
+    """
+    The configuration a command operates on, available as ``conf`` in the
+    click context object.
+
+    Initialized score objects are cached separately for each distinct set of
+    *overrides* passed to :meth:`.load`. At most :attr:`max_loaded` of them
+    are kept, the least recently used one is discarded first.
+
+    Parsing and loading make use of the snapshot created by ``score conf
+    compile``, if there is one, and none of the configuration files were
+    modified since.
+    """
+
+    parse_cache = ParseCache(compiled_folder, readonly=True)
+    max_loaded = 8
 
     def __init__(self, path):
         self.given_path = path
-        self._conf = None
+        self._loaded = OrderedDict()
 
     @property
     def path(self):
         if self.given_path is not None:
             return self.given_path
-        return default_file()
+        file = default_file(create=False)
+        if os.path.exists(file):
+            return file
+        # a missing default configuration used to be created pointing to the
+        # global configuration, which is equivalent to using that directly
+        file = global_file(create=False)
+        if os.path.exists(file):
+            return file
+        raise click.ClickException(
+            'No default configuration found, '
+            'register one with `score conf add\'')
 
     def parse(self):
-        return parse_config_file(self.path)
+        with profile.phase('conf-parse', self.given_path):
+            return self.parse_cache.parse(self.path)
 
-    def load(self, module=None, *, overrides={}):
-        if self._conf is None:
-            self._conf = init_from_file(self.path, overrides=overrides)
+    def load(self, module=None, *, overrides={}, modules=None):
+        """
+        Returns the initialized score object, or the configured module with
+        given alias, if *module* is not `None`.
+
+        Passing a list of module aliases as *modules* will only initialize
+        these modules, the given *module* and their dependencies. All other
+        configured modules are replaced by :class:`.LazyModule` placeholders,
+        which initialize their module and its skipped dependencies when they
+        are first used.
+        """
+        key = _overrides_key(overrides)
+        if modules is not None and key not in self._loaded:
+            modules = set(modules)
+            if module is not None:
+                modules.add(module)
+            conf = self._load('%s:%s' % (key, ','.join(sorted(modules))),
+                              overrides, modules)
+        else:
+            conf = self._load(key, overrides, None)
         if module is None:
-            return self._conf
-        return getattr(self._conf, module)
+            return conf
+        return getattr(conf, module)
+
+    def _load(self, key, overrides, modules):
+        try:
+            conf = self._loaded[key]
+        except KeyError:
+            confdict = self.parse()
+            _add_defaults(confdict, self.path)
+            lazy = []
+            init_overrides = overrides
+            if modules is not None:
+                # the overrides may change the list of modules, they must be
+                # applied before restricting it
+                for section, values in overrides.items():
+                    confdict.setdefault(section, OrderedDict()).update(values)
+                lines = confdict['score.init']['modules']
+                lazy = _restrict(confdict, modules)
+                init_overrides = {}
+            with profile.phase('score-init', self.given_path):
+                conf = init(confdict, overrides=init_overrides)
+            if lazy:
+                # the placeholders initialize from the complete list
+                conf.conf['score.init']['modules'] = lines
+            for alias in lazy:
+                setattr(conf, alias, LazyModule(conf, alias))
+            while len(self._loaded) >= self.max_loaded:
+                self._loaded.popitem(last=False)
+            self._loaded[key] = conf
+        else:
+            self._loaded.move_to_end(key)
+        return conf
+
+    def invalidate(self):
+        """
+        Discards all initialized score objects and the parsed configuration,
+        forcing the next call to :meth:`.load` to initialize from scratch.
+        """
+        self._loaded.clear()
+        self.parse_cache.invalidate(self.path)
+
+
+class LazyModule:
+    """
+    Placeholder for a configured module, that was skipped by a partial
+    :meth:`Configuration.load`. Accessing any of its attributes initializes
+    the module and its skipped dependencies as part of the given *score*
+    object and forwards to the actual module.
+    """
+
+    def __init__(self, score, alias):
+        self._score = score
+        self._alias = alias
+
+    def __getattr__(self, name):
+        module = _init_lazy(self._score, self._alias)
+        return getattr(module, name)
+
+    def __repr__(self):
+        return '<%s %s>' % (type(self).__name__, self._alias)
+
+
+def _parse_modules(confdict):
+    """
+    Parses the ``modules`` list of given *confdict* the way :func:`score.init`
+    does. Returns an ordered dict mapping aliases to module names and a dict
+    mapping aliases to the dependency aliases given in parentheses, as in
+    ``score.db:db(ctx=context)``.
+    """
+    try:
+        lines = parse_list(confdict['score.init']['modules'])
+    except KeyError:
+        lines = []
+    aliases = OrderedDict()
+    dependency_aliases = {}
+    for line in lines:
+        module, sep, alias = line.partition(':')
+        if not sep:
+            alias = module.rsplit('.', 1)[-1]
+        if '(' in alias:
+            alias, assignments = alias.split('(', 1)
+            module = module.split('(', 1)[0]
+            dependency_aliases[alias.strip()] = dict(
+                (key.strip(), value.strip())
+                for key, value in (assignment.split('=') for assignment in
+                                   assignments.strip(' ()').split(',')))
+        aliases[alias.strip()] = module.strip()
+    return aliases, dependency_aliases
+
+
+def _dependencies(alias, aliases, dependency_aliases):
+    """
+    Yields a tuple for each dependency of the module with given *alias*,
+    containing the name of the initializer's parameter, the alias of the
+    module it receives and whether it is optional.
+    """
+    if aliases[alias] == 'score.init':
+        return
+    initializer = importlib.import_module(aliases[alias]).init
+    parameters = list(inspect.signature(initializer).parameters.values())
+    for parameter in parameters[1:]:
+        dependency = dependency_aliases.get(alias, {}).get(
+            parameter.name, parameter.name)
+        optional = parameter.default is not parameter.empty
+        yield parameter.name, dependency, optional
+
+
+def _restrict(confdict, modules):
+    """
+    Removes all modules from the ``modules`` list of given *confdict*, that are
+    neither in the given set of *modules*, nor one of their dependencies.
+    Returns the aliases of the removed modules.
+    """
+    aliases, dependency_aliases = _parse_modules(confdict)
+    for alias in modules:
+        if alias not in aliases:
+            raise click.ClickException(
+                'Module "%s" is not configured' % alias)
+    required = set()
+    pending = list(modules)
+    while pending:
+        alias = pending.pop()
+        if alias in required:
+            continue
+        required.add(alias)
+        for _, dependency, _ in _dependencies(
+                alias, aliases, dependency_aliases):
+            if dependency in aliases:
+                pending.append(dependency)
+    lines = parse_list(confdict['score.init']['modules'])
+    confdict['score.init']['modules'] = '\n'.join(
+        line for line, alias in zip(lines, aliases) if alias in required)
+    return [alias for alias in aliases
+            if alias not in required and aliases[alias] != 'score.init']
+
+
+def _init_lazy(score, alias):
+    """
+    Initializes the module with given *alias*, that was skipped by a partial
+    :meth:`Configuration.load`, as well as all of its skipped dependencies.
+    The modules already present in given *score* object are passed to their
+    initializers as they are, each module is initialized exactly once.
+    """
+    from score.init import ConfigurationError, ConfiguredModule
+    module = getattr(score, alias)
+    if not isinstance(module, LazyModule):
+        return module
+    aliases, dependency_aliases = _parse_modules(score.conf)
+    order = []
+
+    def visit(alias):
+        if alias in order or alias in score._modules:
+            return
+        for _, dependency, _ in _dependencies(
+                alias, aliases, dependency_aliases):
+            if dependency in aliases:
+                visit(dependency)
+        order.append(alias)
+
+    visit(alias)
+    for alias in order:
+        modconf = OrderedDict(score.conf.get(alias, ()))
+        for section, values in score.conf.items():
+            if section.startswith('%s:' % alias):
+                prefix = section[len(alias) + 1:] + '.'
+                modconf.update((prefix + key, value)
+                               for key, value in values.items())
+        kwargs = {}
+        for parameter, dependency, optional in _dependencies(
+                alias, aliases, dependency_aliases):
+            if dependency in score._modules:
+                kwargs[parameter] = score._modules[dependency]
+            elif not optional:
+                raise ConfigurationError(
+                    'score.init', 'Could not find the following '
+                    'dependencies:\n - %s (required by %s)' % (
+                        dependency, alias))
+        with profile.phase('score-init', alias):
+            conf = importlib.import_module(aliases[alias]).init(
+                modconf, **kwargs)
+        if not isinstance(conf, ConfiguredModule):
+            raise ConfigurationError(
+                'score.init', '%s initializer did not return '
+                'ConfiguredModule but %r' % (alias, conf))
+        score._modules[alias] = conf
+        if alias in dependency_aliases:
+            score._module_dependency_aliases[alias] = \
+                dependency_aliases[alias]
+        setattr(score, alias, conf)
+    _finalize(score, order)
+    return getattr(score, order[-1])
+
+
+def _finalize(score, aliases):
+    """
+    Finalizes the modules with given *aliases* in the given *score* object, in
+    the order given by their finalization dependencies.
+    """
+    from score.init import DependencySolver
+    modules = dict(score._modules, score=score)
+    dependencies = {}
+    solver = DependencySolver()
+    for alias in aliases:
+        conf = modules[alias]
+        if isinstance(getattr(conf, '_finalize_dependencies', None), dict):
+            wanted = list(conf._finalize_dependencies.items())
+        elif hasattr(conf, '_finalize_dependencies'):
+            wanted = [(name, True) for name in conf._finalize_dependencies]
+        else:
+            wanted = [(name, parameter.default is not parameter.empty)
+                      for name, parameter in inspect.signature(
+                          conf._finalize).parameters.items()]
+        dependencies[alias] = {}
+        solver.add(alias)
+        for name, optional in wanted:
+            dependency = score._module_dependency_aliases.get(
+                alias, {}).get(name, name)
+            if dependency not in modules and isinstance(
+                    getattr(score, dependency, None), LazyModule):
+                # modules that are still skipped are finalized as soon as
+                # they are initialized themselves
+                modules[dependency] = getattr(score, dependency)
+            if dependency in modules:
+                dependencies[alias][name] = dependency
+                if dependency in aliases:
+                    solver.add(alias, dependency)
+    for alias in solver.solve():
+        kwargs = dict((name, modules[dependency])
+                      for name, dependency in dependencies[alias].items())
+        modules[alias]._finalize(**kwargs)
+        modules[alias]._finalized = True
+
+
+def _add_defaults(confdict, file):
+    """
+    Adds the keys ``here`` and ``cwd`` to every section of given *confdict*
+    parsed from the configuration *file*, just like the configuration parser
+    returned to :func:`score.init.init_from_file` provides them. Like there,
+    configurations based on other files do not receive these keys.
+    """
+    file = os.path.abspath(file)
+    try:
+        files = confdict['score.init']['_files'].split('\n')
+    except KeyError:
+        files = []
+    if file in files:
+        return
+    defaults = OrderedDict([
+        ('here', os.path.dirname(file)),
+        ('cwd', os.path.abspath('.')),
+    ])
+    for values in confdict.values():
+        for key, value in defaults.items():
+            values.setdefault(key, value)
+    confdict['DEFAULT'] = defaults
+
+
+def _overrides_key(overrides):
+    """
+    Returns a hash of given *overrides*, that does not depend on the order of
+    their sections and keys.
+    """
+    canonical = json.dumps(overrides, sort_keys=True, default=repr)
+    return hashlib.sha1(canonical.encode('UTF-8')).hexdigest()
+
+
+def _exit_status(code):
+    """
+    Converts the *code* of a :class:`SystemExit` to an exit status.
+    """
+    if code is None:
+        return 0
+    if isinstance(code, int):
+        return code
+    return 1
+
+
+def _resolve_configurations(ctx, param, value):
+    """
+    Converts the values of the ``--conf`` option to a list of tuples
+    containing the name and the file of each configuration. Values may be
+    files, names of configurations or glob patterns matching names.
+    """
+    result = OrderedDict()
+    for pattern in value:
+        if os.path.isfile(pattern):
+            name = os.path.splitext(os.path.basename(pattern))[0]
+            result[os.path.abspath(pattern)] = name
+            continue
+        if not any(char in pattern for char in '*?['):
+            try:
+                result[get_file(pattern)] = pattern
+            except KeyError:
+                raise click.BadParameter(
+                    'No configuration called `%s\'' % pattern)
+            continue
+        import fnmatch
+        matches = [(name, file) for name, file in name2file().items()
+                   if fnmatch.fnmatchcase(name, pattern)]
+        if not matches:
+            raise click.BadParameter(
+                'No configuration matches `%s\'' % pattern)
+        for name, file in matches:
+            result[file] = name
+    return [(name, file) for file, name in result.items()]
+
+
+def _enable_profile(ctx, param, value):
+    # enabling the profiler in the option's callback makes sure it is active
+    # before the sub-command is resolved
+    if not value:
+        return
+    format, file = profile.parse_spec(value)
+    if format not in profile.FORMATS:
+        raise click.BadParameter(
+            'format must be one of %s' % ', '.join(profile.FORMATS))
+    profile.enable(format, file)
 
 
 @click.command(cls=ScoreCLI)
-@click.option('-c', '--conf', 'conf', help='The configuration to use.')
+@click.option('-c', '--conf', 'conf', multiple=True,
+              callback=_resolve_configurations,
+              help='The configuration to use. Can be passed multiple times '
+                   'and may contain glob patterns to run the command for '
+                   'each matching configuration.')
+@click.option('-j', '--jobs', 'jobs', type=int,
+              help='Number of configurations to run the command for in '
+                   'parallel.')
+@click.option('--profile-startup', 'profile_startup', metavar='FORMAT[:FILE]',
+              callback=_enable_profile, is_eager=True, expose_value=False,
+              help='Report the duration of all startup phases as a table '
+                   'or as json.')
+@click.option('--max-workers', 'max_workers', type=int,
+              envvar='SCORE_CLI_MAX_WORKERS',
+              help='Size of the thread pool available to commands.')
 @click.pass_context
-def main(ctx, conf=None):
-    if conf and not os.path.isfile(conf):
-        conf = get_file(conf)
+def main(ctx, conf=(), jobs=None, max_workers=None):
+    conf = conf[0][1] if conf else None
+    # processes running multiple commands (like the daemon) may pass
+    # initialized Configuration objects in the context object
+    resident = (ctx.obj or {}).get('resident', {})
+    configuration = resident.get(conf)
+    if configuration is None:
+        configuration = Configuration(conf)
     logger = logging.getLogger()
-    ctx.obj = {
-        'conf': Configuration(conf),
+    ctx.obj = ContextObject({
+        'conf': configuration,
         'log': logger,
-    }
+        'max_workers': max_workers,
+    })
+    ctx.call_on_close(ctx.obj.close)
 
 
-def init_score(callback):
+def init_score(callback=None, *, modules=None):
     """
     Decorator for click commands that passes the initialized score application.
+
+    Commands that only need some of the configured modules can list their
+    aliases in *modules* to skip the initialization of all others. Coroutine
+    functions are run on the event loop of the :class:`.ContextObject`::
+
+        @click.command()
+        @init_score(modules=['db'])
+        def vacuum(score):
+            score.db.engine.execute('VACUUM')
     """
+    if callback is None:
+        return functools.partial(init_score, modules=modules)
+
     @click.pass_context
     @functools.wraps(callback)
     def wrapped(clickctx, *args, **kwargs):
-        score = clickctx.obj['conf'].load()
-        return callback(score, *args, **kwargs)
+        score = clickctx.obj['conf'].load(modules=modules)
+        result = callback(score, *args, **kwargs)
+        if inspect.iscoroutine(result):
+            result = run_coroutine(clickctx, result)
+        return result
     return wrapped
 
 
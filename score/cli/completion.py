@@ -0,0 +1,276 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import os
+import shlex
+
+import click
+
+from .conf import name2file, rootdir
+
+
+SHELLS = ('bash', 'zsh', 'fish')
+
+BASH_SCRIPT = r'''
+# completion for the `score' command, generated by `score completion'
+_score_complete() {
+    local root="${VIRTUAL_ENV:+$VIRTUAL_ENV/.score}"
+    root="${root:-%(root)s}"
+    local cache="$root/cache/completion" stale="" index
+    [[ ! -f $cache || $root/conf -nt $cache || %(global)s/conf -nt $cache ]] &&
+        stale=1
+    for index in "$root"/cache/entrypoints-*.json; do
+        [[ $index -nt $cache ]] && stale=1
+    done
+    if [[ -n $stale ]]; then
+        score completion refresh >/dev/null 2>&1
+    fi
+    local cur="${COMP_WORDS[COMP_CWORD]}" prev="${COMP_WORDS[COMP_CWORD-1]}"
+    local key="" word i=1
+    if [[ $prev == -c || $prev == --conf ]]; then
+        key="@conf"
+    else
+        while (( i < COMP_CWORD )); do
+            word="${COMP_WORDS[i]}"
+            case "$word" in
+                -c|--conf|-j|--jobs|--max-workers|--profile-startup)
+                    [[ -z $key ]] && (( i++ )) ;;
+                -*) ;;
+                *) key="${key:+$key }$word" ;;
+            esac
+            (( i++ ))
+        done
+    fi
+    local -A words
+    local name line
+    while IFS=$'\t' read -r name line; do
+        words["${name:-.}"]="$line"
+    done < "$cache"
+    # positional arguments are part of the key, strip words until a known
+    # command is found
+    while [[ -n $key && -z ${words[$key]+x} ]]; do
+        [[ $key == *" "* ]] && key="${key%% *}" || key=""
+    done
+    COMPREPLY=( $(compgen -W "${words[${key:-.}]}" -- "$cur") )
+}
+complete -o default -F _score_complete score
+'''.lstrip()
+
+ZSH_SCRIPT = r'''
+autoload -U +X bashcompinit && bashcompinit
+'''.lstrip() + BASH_SCRIPT
+
+FISH_SCRIPT = r'''
+# completion for the `score' command, generated by `score completion'
+function __score_complete
+    set -l root %(root)s
+    set -q VIRTUAL_ENV; and set root $VIRTUAL_ENV/.score
+    set -l cache $root/cache/completion
+    set -l stale
+    if not test -f $cache; or test $root/conf -nt $cache; \
+            or test %(global)s/conf -nt $cache
+        set stale 1
+    end
+    for index in $root/cache/entrypoints-*.json
+        test $index -nt $cache; and set stale 1
+    end
+    if test -n "$stale"
+        score completion refresh >/dev/null 2>&1
+    end
+    set -l tokens (commandline -opc)
+    set -l key
+    if contains -- $tokens[-1] -c --conf
+        set key @conf
+    else
+        set -l skip 0
+        for token in $tokens[2..-1]
+            if test $skip = 1
+                set skip 0
+            else if contains -- $token -c --conf -j --jobs --max-workers \
+                    --profile-startup
+                test -z "$key"; and set skip 1
+            else if not string match -q -- '-*' $token
+                set -a key $token
+            end
+        end
+    end
+    while true
+        set -l name (string join ' ' $key)
+        test -z "$name"; and set name .
+        set -l line (string match -r -- "^\Q$name\E\t.*" < $cache)
+        if test -n "$line"
+            string split ' ' -- (string split -m1 \t -- $line)[2]
+            return
+        end
+        test (count $key) = 0; and return
+        set -e key[-1]
+    end
+end
+complete -c score -f -a '(__score_complete)'
+'''.lstrip()
+
+SCRIPTS = {
+    'bash': BASH_SCRIPT,
+    'zsh': ZSH_SCRIPT,
+    'fish': FISH_SCRIPT,
+}
+
+
+def cache_file():
+    """
+    Returns the path to the file containing all completion candidates of the
+    current environment.
+    """
+    return os.path.join(rootdir(), 'cache', 'completion')
+
+
+def refresh():
+    """
+    Rebuilds the :func:`completion cache <cache_file>`.
+
+    The file contains a line for each command, consisting of the command's
+    path (or ``.`` for the ``score`` command itself), a tab character and all
+    its sub-commands and options separated by spaces. The configuration names
+    are stored in a line with the path ``@conf``.
+
+    This operation imports every plugin and may thus be quite slow. The
+    generated shell scripts take care of calling it whenever a new plugin or
+    configuration was added.
+    """
+    from .clibase import main
+    lines = []
+    _collect(main, click.Context(main, info_name='score'), [], lines)
+    lines.append('@conf\t%s' % ' '.join(name2file()))
+    file = cache_file()
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmpfile = '%s.%d' % (file, os.getpid())
+    with open(tmpfile, 'w') as fp:
+        fp.write('\n'.join(lines) + '\n')
+    os.replace(tmpfile, file)
+
+
+def _collect(command, ctx, path, lines):
+    from .clibase import LazyCommand
+    if isinstance(command, LazyCommand):
+        command = command.command
+    words = []
+    for param in command.get_params(ctx):
+        if isinstance(param, click.Option):
+            words.extend(param.opts + param.secondary_opts)
+    if isinstance(command, click.MultiCommand):
+        for name in command.list_commands(ctx):
+            try:
+                subcommand = command.get_command(ctx, name)
+            except Exception:
+                # a broken plugin must not prevent completion of all others
+                continue
+            if subcommand is None or getattr(subcommand, 'hidden', False):
+                continue
+            words.append(name)
+            subctx = click.Context(subcommand, info_name=name, parent=ctx)
+            _collect(subcommand, subctx, path + [name], lines)
+    lines.append('%s\t%s' % (' '.join(path) or '.', ' '.join(words)))
+
+
+def generate(shell):
+    """
+    Returns the completion script for given *shell*, which must be one of
+    :data:`SHELLS`.
+    """
+    return SCRIPTS[shell] % {
+        'root': shlex.quote(rootdir()),
+        'global': shlex.quote(rootdir(global_=True)),
+    }
+
+
+def _default_shell():
+    shell = os.path.basename(os.getenv('SHELL', ''))
+    return shell if shell in SHELLS else 'bash'
+
+
+@click.group('completion')
+def main():
+    """
+    Manages shell completion.
+    """
+    pass
+
+
+@main.command('generate')
+@click.option('-s', '--shell', type=click.Choice(SHELLS),
+              default=_default_shell)
+def generate_(shell):
+    """
+    Prints the completion script.
+    """
+    refresh()
+    click.echo(generate(shell), nl=False)
+
+
+@main.command('refresh')
+def refresh_():
+    """
+    Updates the completion candidates.
+    """
+    refresh()
+
+
+@main.command('install')
+@click.option('-s', '--shell', type=click.Choice(SHELLS),
+              default=_default_shell)
+def install(shell):
+    """
+    Installs the completion script.
+    """
+    refresh()
+    home = os.getenv('HOME') or os.getenv('HOMEPATH')
+    if shell == 'fish':
+        file = os.path.join(home, '.config', 'fish', 'completions',
+                            'score.fish')
+        rcfile = None
+    else:
+        file = os.path.join(rootdir(global_=True), 'completion.%s' % shell)
+        rcfile = os.path.join(home, '.%src' % shell)
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    with open(file, 'w') as fp:
+        fp.write(generate(shell))
+    click.echo('Wrote %s' % file)
+    if rcfile is None:
+        return
+    line = 'source %s' % shlex.quote(file)
+    try:
+        with open(rcfile) as fp:
+            if line in fp.read().splitlines():
+                return
+    except FileNotFoundError:
+        pass
+    with open(rcfile, 'a') as fp:
+        fp.write('\n%s\n' % line)
+    click.echo('Added `%s\' to %s' % (line, rcfile))
+
+
+if __name__ == '__main__':
+    main()
@@ -27,9 +27,15 @@
 import os
 import sys
 import re
-from score.init import parse_config_file as parse
 from collections import OrderedDict
+from contextlib import contextmanager
 import textwrap
+import threading
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 class InvalidConfigurationNameException(ValueError):
@@ -108,19 +114,42 @@ def add(name, path, *, venv=None):
     not `None`. The specifics of this behaviour is documented in
     :func:`.rootdir`.
     """
+    add_many({name: path}, venv=venv)
+
+
+def add_many(configurations, *, venv=None):
+    """
+    Adds all *configurations*, which must be a `dict` mapping names to paths,
+    just like :func:`.add` would. All names are validated before the first
+    configuration is written.
+
+    Can also operate on a given virtual environment if the *venv* parameter is
+    not `None`. The specifics of this behaviour is documented in
+    :func:`.rootdir`.
+    """
+    for name in configurations:
+        validate_name(name)
+    root = rootdir(venv=venv)
+    root = os.path.join(root, 'conf')
+    global_ = global_file()
+    with _locked(root):
+        for name, path in configurations.items():
+            _write(os.path.join(root, name), textwrap.dedent('''
+                [score.init]
+                based_on =
+                    %s
+                    %s
+                ''' % (global_, path)))
+
+
+def validate_name(name):
+    """
+    Raises an InvalidConfigurationNameException, if given *name* is not a
+    valid configuration name as described in :func:`.add`.
+    """
     valid_name_regex = r'^[a-zA-Z_][a-zA-Z0-9_-]*$'
     if name.startswith('__') or not re.match(valid_name_regex, name):
         raise InvalidConfigurationNameException(name)
-    root = rootdir(venv=venv)
-    root = os.path.join(root, 'conf')
-    os.makedirs(root, exist_ok=True)
-    file = os.path.join(root, name)
-    open(file, 'w').write(textwrap.dedent('''
-        [score.init]
-        based_on =
-            %s
-            %s
-        ''' % (global_file(), path)))
 
 
 def remove(name, *, venv=None):
@@ -131,11 +160,25 @@ def remove(name, *, venv=None):
     not `None`. The specifics of this behaviour is documented in
     :func:`.rootdir`.
     """
-    file = os.path.join(rootdir(venv=venv), 'conf', name)
-    try:
-        os.unlink(file)
-    except FileNotFoundError:
-        pass
+    remove_many([name], venv=venv)
+
+
+def remove_many(names, *, venv=None):
+    """
+    Deletes all configurations with given *names* while holding the lock on
+    the configuration folder only once.
+
+    Can also operate on a given virtual environment if the *venv* parameter is
+    not `None`. The specifics of this behaviour is documented in
+    :func:`.rootdir`.
+    """
+    root = os.path.join(rootdir(venv=venv), 'conf')
+    with _locked(root):
+        for name in names:
+            try:
+                os.unlink(os.path.join(root, name))
+            except FileNotFoundError:
+                pass
 
 
 def make_default(name, *, venv=None):
@@ -147,26 +190,43 @@ def make_default(name, *, venv=None):
     not `None`. The specifics of this behaviour is documented in
     :func:`.rootdir`.
     """
-    root = rootdir(venv=venv)
-    file = os.path.join(root, 'conf', name)
-    if not os.path.exists(file):
-        raise FileNotFoundError(file)
-    open(default_file(venv=venv), 'w').write(textwrap.dedent('''
+    root = os.path.join(rootdir(venv=venv), 'conf')
+    file = os.path.join(root, name)
+    content = textwrap.dedent('''
         [score.init]
         based_on =
             ${here}/%s
-    ''' % name).lstrip())
+    ''' % name).lstrip()
+    with _locked(root):
+        if not os.path.exists(file):
+            raise FileNotFoundError(file)
+        _write(default_file(venv=venv, create=False), content)
 
 
 def get_file(name, *, venv=None):
     """
     Returns the file the configuration with given *name* is pointing to.
+    Raises a `KeyError` if there is no such configuration.
 
     Can also operate on a given virtual environment if the *venv* parameter is
     not `None`. The specifics of this behaviour is documented in
     :func:`.rootdir`.
     """
-    return name2file(venv=venv)[name]
+    invalid = (
+        not name or
+        name.startswith('__') or
+        name in ('.', '..') or
+        os.sep in name or
+        (os.altsep and os.altsep in name))
+    if invalid:
+        raise KeyError(name)
+    # the configurations in the virtual environment take precedence, just like
+    # they do in name2file()
+    for folder in reversed(_conf_folders(venv=venv)):
+        file = os.path.join(folder, name)
+        if os.path.exists(file):
+            return file
+    raise KeyError(name)
 
 
 def get_default(*, venv=None):
@@ -178,7 +238,8 @@ def get_default(*, venv=None):
     :func:`.rootdir`.
     """
     try:
-        return os.path.basename(get_origin(default_file(venv=venv)))
+        return os.path.basename(
+            get_origin(default_file(venv=venv, create=False)))
     except FileNotFoundError:
         return None
 
@@ -195,17 +256,7 @@ def name2file(*, include_global=True, venv=None):
     :func:`.rootdir`.
     """
     files = {}
-    if include_global:
-        folder = os.getenv('HOME') or os.getenv('HOMEPATH')
-        folder = os.path.join(folder, '.score', 'conf')
-        try:
-            for file in os.listdir(folder):
-                files[file] = os.path.join(folder, file)
-        except FileNotFoundError:
-            pass
-    folder = venv_root(venv)
-    if folder:
-        folder = os.path.join(folder, '.score', 'conf')
+    for folder in _conf_folders(include_global=include_global, venv=venv):
         try:
             for file in os.listdir(folder):
                 files[file] = os.path.join(folder, file)
@@ -219,32 +270,46 @@ def name2file(*, include_global=True, venv=None):
     return sortedfiles
 
 
-def global_file():
+def _conf_folders(*, include_global=True, venv=None):
+    """
+    Returns the configuration folders to consult, in ascending order of
+    precedence.
+    """
+    folders = []
+    if include_global:
+        folder = os.getenv('HOME') or os.getenv('HOMEPATH')
+        folders.append(os.path.join(folder, '.score', 'conf'))
+    folder = venv_root(venv)
+    if folder:
+        folders.append(os.path.join(folder, '.score', 'conf'))
+    return folders
+
+
+def global_file(*, create=True):
     """
     Returns the path to the global configuration file.
 
     Although the return value of this function is always the same, it ensures
     that the file actually exists by creating it with some informative
-    comments.
+    comments. Passing a falsy value for *create* will skip this step and
+    just return the path.
     """
     file = os.path.join(rootdir(global_=True), 'conf', '__global__')
-    os.makedirs(os.path.dirname(file), exist_ok=True)
-    try:
-        open(file, 'x').write(textwrap.dedent('''
+    if create:
+        _ensure(file, textwrap.dedent('''
             # This is the global CLI configuration file for your SCORE
             # installation. The values defined here will be available in
             # *all* your command line applications.
         ''').lstrip())
-    except FileExistsError:
-        pass
     return file
 
 
-def default_file(*, global_=False, venv=None):
+def default_file(*, global_=False, venv=None, create=True):
     """
     Returns the path to the default configuration in the current environment.
 
-    This function will create that file, if it does not exist.
+    This function will create that file, if it does not exist, unless
+    *create* is falsy.
 
     Can also operate on a given virtual environment if the *venv* parameter is
     not `None`. The specifics of this behaviour is documented in
@@ -252,24 +317,189 @@ def default_file(*, global_=False, venv=None):
     """
     file = os.path.join(rootdir(global_=global_, venv=venv),
                         'conf', '__default__')
-    os.makedirs(os.path.dirname(file), exist_ok=True)
-    try:
-        open(file, 'x').write(textwrap.dedent('''
+    if create:
+        _ensure(file, lambda: textwrap.dedent('''
             [score.init]
             based_on = %s
         ''' % global_file()).lstrip())
-    except FileExistsError:
-        pass
     return file
 
 
+_ensured = set()
+
+
+def _ensure(file, content):
+    """
+    Creates given *file* with given *content*, unless it already exists. The
+    *content* may also be a callable returning the content.
+
+    Every file is checked once per process only.
+    """
+    if file in _ensured:
+        return
+    if not os.path.exists(file):
+        if callable(content):
+            content = content()
+        with _locked(os.path.dirname(file)):
+            if not os.path.exists(file):
+                _write(file, content)
+    _ensured.add(file)
+
+
+def _write(file, content):
+    """
+    Replaces the contents of given *file* atomically, so concurrent readers
+    either see the previous or the new content, but never a partially written
+    file. The temporary file's name starts with two underscores, so it is
+    never mistaken for a configuration.
+    """
+    import tempfile
+    fd, tmpfile = tempfile.mkstemp(prefix='__tmp', dir=os.path.dirname(file))
+    try:
+        with os.fdopen(fd, 'w') as fp:
+            fp.write(content)
+        # mkstemp() creates the file readable by its owner only, the
+        # configuration should receive the same mode as with open()
+        os.chmod(tmpfile, 0o666 & ~_umask())
+        os.replace(tmpfile, file)
+    except BaseException:
+        try:
+            os.unlink(tmpfile)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+_process_umask = None
+
+
+def _umask():
+    """
+    Returns the umask of this process. It can only be read by setting it, so
+    it is read once to keep the window, in which other threads would create
+    files with a wrong mode, as short as possible.
+    """
+    global _process_umask
+    if _process_umask is None:
+        with _locks_guard:
+            if _process_umask is None:
+                _process_umask = os.umask(0o022)
+                os.umask(_process_umask)
+    return _process_umask
+
+
+_locks = {}
+_locks_guard = threading.Lock()
+_depths = {}
+
+
+@contextmanager
+def _locked(folder):
+    """
+    Holds an advisory lock on given configuration *folder*, creating the folder
+    if necessary. The lock is re-entrant within the same thread and excludes
+    other threads of the same process, too. Locking the file is skipped on
+    platforms without :mod:`fcntl`.
+    """
+    folder = os.path.abspath(folder)
+    with _locks_guard:
+        lock = _locks.setdefault(folder, threading.RLock())
+    with lock:
+        # only the thread holding the lock gets here, so the depth can be
+        # read and updated without further synchronization
+        depth = _depths.get(folder, 0)
+        _depths[folder] = depth + 1
+        try:
+            if depth:
+                yield
+                return
+            os.makedirs(folder, exist_ok=True)
+            if fcntl is None:
+                yield
+                return
+            with open(os.path.join(folder, '__lock__'), 'a') as fp:
+                fcntl.flock(fp, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(fp, fcntl.LOCK_UN)
+        finally:
+            _depths[folder] = depth
+
+
 def get_origin(file):
     """
     Parses given configuration file and finds the file this one is
     :func:`based_on <score.init.parse_config_file>`.
+
+    Only the ``based_on`` value is read from the file, unless it contains
+    interpolations other than ``${here}`` and ``${cwd}``, in which case the
+    file is parsed completely. The result is cached for as long as the file
+    remains unchanged.
     """
-    parsedconf = parse(file, recurse=False)
-    base = parsedconf['score.init']['based_on']
-    if '\n' in base:
-        base = base.split('\n')[-1]
+    stat = os.stat(file)
+    key = (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+    try:
+        cached_key, base = _origins[file]
+        if cached_key == key:
+            return base
+    except KeyError:
+        pass
+    base = _read_based_on(file)
+    if base is None or '$' in base:
+        from score.init import parse_config_file as parse
+        parsedconf = parse(file, recurse=False)
+        base = parsedconf['score.init']['based_on']
+        if '\n' in base:
+            base = base.split('\n')[-1]
+    _origins[file] = (key, base)
+    return base
+
+
+_origins = {}
+
+_section_regex = re.compile(r'^\[(?P<name>[^\]]+)\]')
+_based_on_regex = re.compile(r'^based_on\s*[=:](?P<value>.*)$')
+
+
+def _read_based_on(file):
+    """
+    Extracts the last line of the ``based_on`` value in the ``score.init``
+    section of given *file* without parsing it. Will return `None`, if the
+    value could not be determined this way.
+    """
+    section = None
+    lines = None
+    with open(file) as fp:
+        for line in fp:
+            stripped = line.strip()
+            if lines is not None:
+                if not stripped or stripped[0] in '#;':
+                    continue
+                if line[0] in ' \t':
+                    lines.append(stripped)
+                    continue
+                break
+            match = _section_regex.match(line)
+            if match:
+                section = match.group('name')
+                continue
+            if section != 'score.init':
+                continue
+            match = _based_on_regex.match(line)
+            if match:
+                lines = [match.group('value').strip()]
+    if lines is None:
+        # the key may still be present in a form configparser accepts, like
+        # an indented key, leave that to the full parse
+        return None
+    lines = [line for line in lines if line]
+    if not lines:
+        return ''
+    base = lines[-1]
+    here = os.path.abspath(os.path.dirname(file))
+    base = base.replace('${here}', here)
+    base = base.replace('${cwd}', os.path.abspath('.'))
+    if '$' in base:
+        return None
     return base
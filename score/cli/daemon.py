@@ -0,0 +1,252 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import array
+import json
+import os
+import signal
+import socket
+import struct
+import sys
+
+import click
+
+from . import entrypoints
+from .conf import rootdir
+
+
+_header = struct.Struct('!I')
+_exitcode = struct.Struct('!i')
+
+# environment variable passing the sockets to a restarted daemon
+_INHERIT = 'SCORE_CLI_DAEMON_SOCKETS'
+
+
+def socket_file():
+    """
+    Returns the default path of the daemon's UNIX socket.
+    """
+    return os.path.join(rootdir(), 'daemon.sock')
+
+
+def forward(argv, *, path=None):
+    """
+    Runs the ``score`` command given as an argument list in the daemon
+    listening on the socket at *path* (defaults to :func:`.socket_file`) and
+    returns its exit code.
+
+    The daemon receives the current process' working directory, environment
+    and standard streams, so the command behaves just like it would when run
+    locally. Returns `None` without running the command, if the daemon is not
+    running.
+    """
+    if path is None:
+        path = socket_file()
+    env = dict(os.environ)
+    # the command must not try to forward itself again
+    env.pop('SCORE_CLI_DAEMON', None)
+    request = json.dumps({
+        'argv': list(argv),
+        'cwd': os.getcwd(),
+        'env': env,
+    }).encode('UTF-8')
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        try:
+            sock.connect(path)
+        except (FileNotFoundError, ConnectionRefusedError):
+            return None
+        sys.stdout.flush()
+        sys.stderr.flush()
+        _send_fds(sock, _header.pack(len(request)), [0, 1, 2])
+        sock.sendall(request)
+        response = _recvall(sock, _exitcode.size)
+    finally:
+        sock.close()
+    if response is None:
+        # the worker died without reporting an exit code
+        return 1
+    return _exitcode.unpack(response)[0]
+
+
+class Daemon:
+    """
+    Server keeping initialized configurations resident and running the
+    commands :func:`forwarded <.forward>` to it in forked worker processes.
+    """
+
+    def __init__(self, path):
+        from .runner import Preloader
+        self.path = path
+        self.preloader = Preloader()
+
+    def serve_forever(self):
+        """
+        Listens on the configured socket until the process is terminated.
+
+        The daemon restarts itself as soon as a distribution is installed,
+        upgraded or removed, since the plugins it imported might be outdated.
+        The restarted daemon keeps listening on the same socket and handles
+        the request that revealed the change first.
+        """
+        inherited = os.environ.pop(_INHERIT, None)
+        if inherited:
+            server_fd, conn_fd = map(int, inherited.split(','))
+            server = socket.socket(fileno=server_fd)
+            pending = socket.socket(fileno=conn_fd)
+        else:
+            server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            pending = None
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            umask = os.umask(0o177)
+            try:
+                server.bind(self.path)
+            finally:
+                os.umask(umask)
+            server.listen()
+        entrypoints.commands()
+        # the workers report their exit code through the connection, there
+        # is no need to wait for them
+        signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+        signal.signal(signal.SIGTERM, lambda *args: sys.exit(0))
+        try:
+            while True:
+                if pending is not None:
+                    conn, pending = pending, None
+                else:
+                    conn, _ = server.accept()
+                if entrypoints.outdated():
+                    self._restart(server, conn)
+                try:
+                    self.handle(conn)
+                except Exception as e:
+                    click.echo('Could not handle request: %s' % e, err=True)
+                finally:
+                    conn.close()
+        finally:
+            server.close()
+            os.unlink(self.path)
+
+    def _restart(self, server, conn):
+        """
+        Replaces the current process with a new daemon, passing it the
+        listening *server* socket and the connection *conn*, which is yet to
+        be handled.
+        """
+        click.echo('Installed distributions changed, restarting', err=True)
+        os.set_inheritable(server.fileno(), True)
+        os.set_inheritable(conn.fileno(), True)
+        os.environ[_INHERIT] = '%d,%d' % (server.fileno(), conn.fileno())
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os.execv(sys.executable,
+                 [sys.executable, '-m', 'score.cli'] + sys.argv[1:])
+
+    def handle(self, conn):
+        """
+        Reads a request from given connection and runs it in a worker.
+        """
+        msg, fds = _recv_fds(conn, _header.size, 3)
+        try:
+            if len(msg) != _header.size or len(fds) != 3:
+                raise ValueError('Malformed request')
+            body = _recvall(conn, _header.unpack(msg)[0])
+            if body is None:
+                raise ValueError('Incomplete request')
+            request = json.loads(body.decode('UTF-8'))
+            # configurations may depend on the client's working directory
+            cwd = os.getcwd()
+            try:
+                os.chdir(request['cwd'])
+                self.preloader.preload(request['argv'])
+            except OSError:
+                pass
+            finally:
+                os.chdir(cwd)
+            self.preloader.fork(
+                request['argv'],
+                stdin=fds[0], stdout=fds[1], stderr=fds[2],
+                cwd=request['cwd'], env=request['env'],
+                report=lambda code: conn.sendall(_exitcode.pack(code)))
+        finally:
+            for fd in fds:
+                os.close(fd)
+
+
+# socket.send_fds() and socket.recv_fds() are only available since python 3.9
+
+def _send_fds(sock, data, fds):
+    """
+    Sends *data* along with the given file descriptors *fds* over the UNIX
+    socket *sock*.
+    """
+    sock.sendmsg([data], [(socket.SOL_SOCKET, socket.SCM_RIGHTS,
+                           array.array('i', fds))])
+
+
+def _recv_fds(sock, size, maxfds):
+    """
+    Receives up to *size* bytes and up to *maxfds* file descriptors from the
+    UNIX socket *sock*. Returns the data and the list of file descriptors.
+    """
+    fds = array.array('i')
+    msg, ancdata, _, _ = sock.recvmsg(
+        size, socket.CMSG_SPACE(maxfds * fds.itemsize))
+    for level, type, data in ancdata:
+        if level == socket.SOL_SOCKET and type == socket.SCM_RIGHTS:
+            # ignore a truncated trailing item
+            fds.frombytes(data[:len(data) - (len(data) % fds.itemsize)])
+    return msg, list(fds)
+
+
+def _recvall(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+@click.command('daemon')
+@click.option('-s', '--socket', 'path', help='The socket to listen on.')
+@click.option('-p', '--preload', 'preload', multiple=True,
+              help='A configuration to initialize right away.')
+def main(path=None, preload=()):
+    """
+    Runs commands in preloaded processes.
+    """
+    daemon = Daemon(path or socket_file())
+    for conf in preload:
+        daemon.preloader.preload(['-c', conf])
+    daemon.serve_forever()
+
+
+if __name__ == '__main__':
+    main()
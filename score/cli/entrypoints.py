@@ -0,0 +1,269 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import hashlib
+import importlib
+import inspect
+import json
+import os
+import sys
+
+from . import profile
+from .conf import rootdir
+
+
+GROUP = 'score.cli'
+
+_data = None
+_index = None
+
+
+class EntryPoint:
+    """
+    A ``score.cli`` entry point as stored in the :func:`index <index_file>`.
+
+    The *value* is the entry point's object reference in the usual
+    ``module:attr`` notation, *dist* is a human readable description of the
+    distribution providing it.
+    """
+
+    def __init__(self, name, value, dist):
+        self.name = name
+        self.value = value
+        self.dist = dist
+
+    def load(self):
+        """
+        Imports the referenced module and returns the referenced object.
+        """
+        from .plugins import apply_pycache_prefix
+        apply_pycache_prefix()
+        module, _, attrs = self.value.partition(':')
+        with profile.phase('plugin-load', self.name):
+            result = importlib.import_module(module.strip())
+        for attr in attrs.split('[')[0].strip().split('.'):
+            if attr:
+                result = getattr(result, attr)
+        return result
+
+
+def index_file():
+    """
+    Returns the path to the file caching all ``score.cli`` entry points of the
+    current environment.
+    """
+    # interpreters with different search paths (like the `score' script and
+    # `python -m score.cli') see different distributions and need separate
+    # index files
+    digest = hashlib.sha1('\n'.join(_search_path()).encode('UTF-8'))
+    return os.path.join(rootdir(), 'cache',
+                        'entrypoints-%s.json' % digest.hexdigest()[:12])
+
+
+def commands(*, refresh=False):
+    """
+    Returns a `dict` mapping command names to lists of :class:`.EntryPoint`
+    objects. The list will contain more than one entry point, if multiple
+    distributions register a command with the same name.
+
+    The result is read from the :func:`index file <index_file>`, which is
+    rebuilt automatically whenever the folders in :data:`sys.path` or the
+    metadata folders of the distributions providing commands are modified.
+    Passing a truthy *refresh* value will rebuild the index unconditionally.
+    """
+    global _data, _index
+    if _index is None or refresh:
+        with profile.phase('entrypoints', 'index'):
+            _data = None if refresh else _read_index()
+        if _data is None:
+            with profile.phase('entrypoints', 'scan'):
+                _data = _scan()
+                _write_index(_data)
+        _index = {}
+        for name, entries in _data['commands'].items():
+            _index[name] = [EntryPoint(name, value, dist)
+                            for value, dist in entries]
+    return _index
+
+
+def outdated():
+    """
+    Whether distributions were installed, upgraded or removed since
+    :func:`.commands` read the index in this process. Long running processes
+    hold outdated entry points and possibly outdated plugin modules in that
+    case.
+    """
+    if _data is None:
+        return False
+    fingerprint = _fingerprint(_data['metadirs'], _data['files'])
+    return fingerprint != _data['fingerprint']
+
+
+def summary(name):
+    """
+    Returns the cached summary of the command with given *name*, as stored via
+    :func:`.store_summary`. The return value is a `dict` with the keys
+    ``help``, ``short_help`` and ``hidden``, or `None`, if the command was
+    never loaded since the index was last rebuilt.
+    """
+    commands()
+    return _data['summaries'].get(name)
+
+
+def store_summary(name, command):
+    """
+    Stores the help texts of given :class:`click.Command` in the index, which
+    allows rendering the list of commands without importing them.
+    """
+    commands()
+    help = getattr(command, 'help', None)
+    if help:
+        help = inspect.cleandoc(help).split('\n\n')[0]
+    _data['summaries'][name] = {
+        'help': help,
+        'short_help': getattr(command, 'short_help', None),
+        'hidden': getattr(command, 'hidden', False),
+    }
+    _write_index(_data)
+
+
+def _read_index():
+    try:
+        with open(index_file()) as fp:
+            data = json.load(fp)
+    except (OSError, ValueError):
+        return None
+    if data.get('path') != _search_path():
+        return None
+    fingerprint = _fingerprint(data['metadirs'], data.get('files', ()))
+    if fingerprint != data['fingerprint']:
+        return None
+    return data
+
+
+def _write_index(data):
+    file = index_file()
+    tmpfile = '%s.%d' % (file, os.getpid())
+    try:
+        os.makedirs(os.path.dirname(file), exist_ok=True)
+        with open(tmpfile, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmpfile, file)
+    except OSError:
+        # the index is just a cache, failing to write it (in a read-only home
+        # folder, for example) must not break the command
+        pass
+
+
+def _scan():
+    import importlib.metadata
+    commands = {}
+    metadirs = set()
+    seen = set()
+    for dist in importlib.metadata.distributions():
+        name = dist.metadata['Name']
+        if name in seen:
+            # the same distribution may be found multiple times, if it is
+            # reachable through multiple sys.path entries. the first one
+            # shadows all others, just like it would during import.
+            continue
+        seen.add(name)
+        metadir = getattr(dist, '_path', None)
+        if metadir:
+            # any distribution may start providing commands by rewriting its
+            # entry_points.txt in place, as `setup.py develop' does
+            metadirs.add(str(metadir))
+        label = '%s %s' % (name, dist.version)
+        for entrypoint in dist.entry_points:
+            if entrypoint.group != GROUP:
+                continue
+            commands.setdefault(entrypoint.name, []).append(
+                (entrypoint.value, label))
+    metadirs = sorted(metadirs)
+    files = _link_files()
+    return {
+        'path': _search_path(),
+        'metadirs': metadirs,
+        'files': files,
+        'fingerprint': _fingerprint(metadirs, files),
+        'commands': commands,
+        'summaries': {},
+    }
+
+
+def _link_files():
+    """
+    Returns all ``.pth`` and ``.egg-link`` files in the :func:`search path
+    <_search_path>`, which may add further folders containing distributions
+    when modified.
+    """
+    files = []
+    for path in _search_path():
+        try:
+            names = os.listdir(path)
+        except OSError:
+            continue
+        for name in sorted(names):
+            if name.endswith(('.pth', '.egg-link')):
+                files.append(os.path.join(path, name))
+    return files
+
+
+def _search_path():
+    """
+    Returns :data:`sys.path` without the current working directory, which is
+    part of the path when running ``python -m score.cli``, but changes far too
+    often to be considered a distribution folder.
+    """
+    cwd = os.getcwd()
+    return [path for path in sys.path if path and path != cwd]
+
+
+def _fingerprint(metadirs, files=()):
+    """
+    Collects the modification times of all :func:`search path <_search_path>`
+    entries and the given metadata folders, as well as the modification times
+    and sizes of the ``entry_points.txt`` file in each metadata folder and of
+    the given *files*. Installing or removing a distribution always modifies
+    the folder it is installed into, while re-installing one in place
+    modifies its metadata folder or rewrites its ``entry_points.txt``.
+    """
+    result = []
+    for path in _search_path() + metadirs:
+        try:
+            result.append(os.stat(path).st_mtime_ns)
+        except OSError:
+            result.append(None)
+    files = list(files) + [os.path.join(metadir, 'entry_points.txt')
+                           for metadir in metadirs]
+    for file in files:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            result.append(None)
+        else:
+            result.append([stat.st_mtime_ns, stat.st_size])
+    return result
@@ -0,0 +1,259 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Optional per-invocation metrics of the ``score`` command.
+
+Setting the environment variable ``SCORE_CLI_METRICS`` to a sink
+specification of the form ``KIND:TARGET`` writes one record for every
+invocation. Supported kinds are listed in :data:`SINKS`.
+"""
+
+import hashlib
+import json
+import os
+import sys
+import time
+
+from . import profile
+
+
+# phases contained in the duration of the `command' phase
+_NESTED_PHASES = ('conf-parse', 'score-init')
+
+_collector = None
+
+
+class Collector:
+    """
+    Collects the durations of all :func:`phases <score.cli.profile.phase>` of
+    a single invocation, as well as the invoked command and the name of the
+    configuration it operated on.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+        self.start = time.perf_counter()
+        self.phases = []
+        self.command = None
+        self.configuration = None
+
+    def __call__(self, name, detail, duration):
+        self.phases.append((name, detail, duration))
+
+    def record(self, status):
+        """
+        Returns the `dict` describing the invocation, which ended with given
+        exit *status*.
+        """
+        phases = {}
+        command = self.command
+        for name, detail, duration in self.phases:
+            phases[name] = phases.get(name, 0.0) + duration
+            if name == 'command' and detail:
+                # the callback of the innermost command finishes last
+                command = detail
+        if 'command' in phases:
+            nested = sum(phases.get(name, 0.0) for name in _NESTED_PHASES)
+            phases['command'] = max(phases['command'] - nested, 0.0)
+        return {
+            'timestamp': time.time(),
+            'command': command,
+            'configuration': self.configuration,
+            'status': status,
+            'duration': time.perf_counter() - self.start,
+            'phases': phases,
+            'peak_rss': peak_rss(),
+            'pid': os.getpid(),
+        }
+
+
+class JsonLinesSink:
+    """
+    Appends every record as a line of JSON to given *file*.
+    """
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, record):
+        line = (json.dumps(record, sort_keys=True) + '\n').encode('UTF-8')
+        # a single write to a file opened in append mode is not interleaved
+        # with the writes of concurrent processes
+        fd = os.open(self.file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            os.write(fd, line)
+        finally:
+            os.close(fd)
+
+
+class PrometheusSink:
+    """
+    Writes the metrics of the latest invocation of each command and
+    configuration to a file in given *folder*, which is expected to be read by
+    the textfile collector of the Prometheus node exporter.
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def write(self, record):
+        labels = 'command="%s",configuration="%s"' % (
+            _escape(record['command'] or ''),
+            _escape(record['configuration'] or ''))
+        lines = [
+            '# TYPE score_cli_last_run_timestamp_seconds gauge',
+            'score_cli_last_run_timestamp_seconds{%s} %f' % (
+                labels, record['timestamp']),
+            '# TYPE score_cli_exit_status gauge',
+            'score_cli_exit_status{%s} %d' % (labels, record['status']),
+            '# TYPE score_cli_duration_seconds gauge',
+            'score_cli_duration_seconds{%s} %f' % (
+                labels, record['duration']),
+            '# TYPE score_cli_phase_duration_seconds gauge',
+        ]
+        for phase, duration in sorted(record['phases'].items()):
+            lines.append('score_cli_phase_duration_seconds{%s,phase="%s"} %f' %
+                         (labels, _escape(phase), duration))
+        if record['peak_rss'] is not None:
+            lines.append('# TYPE score_cli_peak_rss_bytes gauge')
+            lines.append('score_cli_peak_rss_bytes{%s} %d' % (
+                labels, record['peak_rss']))
+        digest = hashlib.sha1(labels.encode('UTF-8')).hexdigest()[:12]
+        file = os.path.join(self.folder, 'score_cli_%s.prom' % digest)
+        # the collector ignores files not ending in `.prom', so the file can
+        # be replaced atomically
+        tmpfile = '%s.%d.tmp' % (file, os.getpid())
+        with open(tmpfile, 'w') as fp:
+            fp.write('\n'.join(lines) + '\n')
+        os.replace(tmpfile, file)
+
+
+class DatagramSink:
+    """
+    Sends every record as JSON to the UNIX datagram *socket*.
+    """
+
+    def __init__(self, socket):
+        self.socket = socket
+
+    def write(self, record):
+        import socket
+        data = json.dumps(record, sort_keys=True).encode('UTF-8')
+        with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as sock:
+            sock.sendto(data, self.socket)
+
+
+SINKS = {
+    'jsonl': JsonLinesSink,
+    'prometheus': PrometheusSink,
+    'unix': DatagramSink,
+}
+
+
+def open_sink(spec):
+    """
+    Creates the sink described by given specification of the form
+    ``KIND:TARGET``. Raises a `ValueError` if the specification is invalid.
+    """
+    kind, _, target = spec.partition(':')
+    if kind not in SINKS or not target:
+        raise ValueError('Invalid metrics sink: %s' % spec)
+    return SINKS[kind](target)
+
+
+def start(spec=None):
+    """
+    Starts collecting metrics for the current invocation, if a sink is given
+    as *spec* or in the environment variable ``SCORE_CLI_METRICS``. Returns
+    the :class:`.Collector`, or `None`.
+    """
+    global _collector
+    spec = spec or os.getenv('SCORE_CLI_METRICS')
+    if not spec:
+        return None
+    try:
+        sink = open_sink(spec)
+    except ValueError as e:
+        print(e, file=sys.stderr)
+        return None
+    _collector = Collector(sink)
+    profile.observe(_collector)
+    return _collector
+
+
+def current():
+    """
+    Returns the active :class:`.Collector`, or `None`.
+    """
+    return _collector
+
+
+def stop(status):
+    """
+    Stops collecting and writes the record of the invocation, which ended
+    with given exit *status*, to the sink.
+    """
+    global _collector
+    collector, _collector = _collector, None
+    if collector is None:
+        return
+    profile.unobserve(collector)
+    try:
+        collector.sink.write(collector.record(status))
+    except OSError:
+        # metrics must never break the command itself
+        pass
+
+
+def reset():
+    """
+    Discards the active :class:`.Collector` without writing its record.
+    Forked child processes call this, the record belongs to their parent.
+    """
+    global _collector
+    if _collector is not None:
+        profile.unobserve(_collector)
+    _collector = None
+
+
+def peak_rss():
+    """
+    Returns the peak resident set size of the current process in bytes, or
+    `None`, if it cannot be determined on this platform.
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return maxrss
+    return maxrss * 1024
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
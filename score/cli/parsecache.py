@@ -0,0 +1,347 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import configparser
+import hashlib
+import marshal
+import os
+from collections import OrderedDict
+from glob import glob
+
+from score.init import parse_config_file, parse_list
+
+from .conf import rootdir
+
+
+FORMAT_VERSION = 3
+
+
+class ParseCache:
+    """
+    Memoizes the results of :func:`score.init.parse_config_file`.
+
+    Every parsed configuration is stored along with the :func:`.fingerprint`
+    of all files that were involved in parsing it, i.e. the file itself and
+    all files it is :func:`based on <score.init.parse_config_file>` or
+    includes, as well as the files matching its include patterns. A cached
+    configuration is re-used for as long as none of these files was modified
+    or removed, and no new file matches one of the include patterns.
+    Configurations referring to the current working directory via ``${cwd}``
+    or via relative include patterns are cached separately for each working
+    directory.
+
+    Cached configurations are kept in memory by default. If a *folder* is
+    given, they are also serialized into that folder, which allows sharing
+    them between processes. The *folder* may also be a callable returning the
+    folder. A *readonly* cache will use the configurations found in the
+    folder, but will only write to it when :meth:`compiling <.compile>`.
+    """
+
+    def __init__(self, folder=None, *, readonly=False):
+        self.folder = folder
+        self.readonly = readonly
+        self._entries = {}
+        self._pending = {}
+
+    def parse(self, file):
+        """
+        Returns the parsed configuration *file*, just like
+        :func:`score.init.parse_config_file` would. Every call returns a new
+        copy of the configuration, so callers are free to modify it.
+        """
+        file = os.path.abspath(file)
+        entry = self._lookup(file)
+        if entry is None:
+            entry = self._parse(file)
+            if not self.readonly:
+                self._write(self._complete(file))
+        return _thaw(entry[3])
+
+    def compile(self, file):
+        """
+        Parses the configuration *file* and writes the result into the
+        cache's folder, even if the cache is *readonly*. Returns the list of
+        files the configuration was assembled from.
+        """
+        if self._folder() is None:
+            raise ValueError('Cannot compile without a cache folder')
+        file = os.path.abspath(file)
+        entry = None
+        while entry is None:
+            self._parse(file)
+            entry = self._complete(file)
+        self._write(entry)
+        return list(entry[1])
+
+    def files(self, file):
+        """
+        Returns the list of files the cached configuration *file* was
+        assembled from, or `None`, if the file was not parsed through this
+        cache yet.
+        """
+        file = os.path.abspath(file)
+        self._complete(file)
+        for key in self._keys(file):
+            if key in self._entries:
+                return list(self._entries[key][1])
+        return None
+
+    def includes(self, file):
+        """
+        Returns the list of include patterns of the cached configuration
+        *file*, or `None`, if the file was not parsed through this cache yet.
+        The patterns must be passed to :func:`.fingerprint` along with the
+        :meth:`files <.files>` to detect all changes to the configuration.
+        """
+        file = os.path.abspath(file)
+        self._complete(file)
+        for key in self._keys(file):
+            if key in self._entries:
+                return list(self._entries[key][4])
+        return None
+
+    def depends_on_cwd(self, file):
+        """
+        Whether the cached configuration *file* depends on the current working
+        directory, i.e. refers to ``${cwd}`` or has relative include patterns.
+        Returns `None`, if the file was not parsed through this cache yet.
+        """
+        file = os.path.abspath(file)
+        self._complete(file)
+        if (file, None) in self._entries:
+            return False
+        if (file, os.getcwd()) in self._entries:
+            return True
+        return None
+
+    def invalidate(self, file=None):
+        """
+        Removes the configuration *file* from the cache. Will clear the whole
+        cache, if no *file* is given. A *readonly* cache will only forget the
+        configurations it keeps in memory.
+        """
+        if file is None:
+            self._pending.clear()
+            keys = list(self._entries)
+        else:
+            file = os.path.abspath(file)
+            self._pending.pop(file, None)
+            keys = self._keys(file)
+        for key in keys:
+            self._entries.pop(key, None)
+            if self._folder() and not self.readonly:
+                try:
+                    os.unlink(self._path(key))
+                except FileNotFoundError:
+                    pass
+
+    def _folder(self):
+        if callable(self.folder):
+            return self.folder()
+        return self.folder
+
+    def _keys(self, file):
+        return [(file, None), (file, os.getcwd())]
+
+    def _lookup(self, file):
+        self._complete(file)
+        for key in self._keys(file):
+            entry = self._entries.get(key)
+            if entry is None and self._folder():
+                entry = self._read(key)
+            if entry is None:
+                continue
+            if fingerprint(entry[1], entry[4]) == entry[2]:
+                self._entries[key] = entry
+                return entry
+        return None
+
+    def _parse(self, file):
+        # finding the include patterns requires parsing every file a second
+        # time, which is postponed until the result is actually re-used
+        confdict = parse_config_file(file)
+        files = chain(file, confdict)
+        entry = (os.getcwd(), files, _stat(files), _freeze(confdict))
+        self._pending[file] = entry
+        return (None,) + entry[1:]
+
+    def _complete(self, file):
+        """
+        Determines the include patterns and the working directory dependency
+        of the configuration *file*, if it was just :meth:`parsed <._parse>`,
+        and stores it as a regular entry. Returns that entry, or `None` if
+        there is none or if the parsed configuration is already outdated.
+        """
+        try:
+            cwd, files, stats, frozen = self._pending.pop(file)
+        except KeyError:
+            return None
+        patterns = include_patterns(files)
+        uses_cwd = _uses_cwd(files) or not all(map(os.path.isabs, patterns))
+        if uses_cwd and cwd != os.getcwd():
+            return None
+        matches = _matches(patterns)
+        included = set(match for group in matches for match in group)
+        if not included <= set(files):
+            # a file matching one of the patterns was added since parsing
+            return None
+        key = (file, cwd if uses_cwd else None)
+        entry = (key, files, stats + matches, frozen, patterns)
+        self._entries[key] = entry
+        return entry
+
+    def _path(self, key):
+        digest = hashlib.sha1(repr(key).encode('UTF-8')).hexdigest()
+        return os.path.join(self._folder(), digest)
+
+    def _read(self, key):
+        try:
+            with open(self._path(key), 'rb') as fp:
+                version, entry = marshal.load(fp)
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+        if version != FORMAT_VERSION or tuple(entry[0]) != key:
+            return None
+        return entry
+
+    def _write(self, entry):
+        folder = self._folder()
+        if not folder or entry is None:
+            return
+        file = self._path(entry[0])
+        tmpfile = '%s.%d' % (file, os.getpid())
+        try:
+            os.makedirs(folder, exist_ok=True)
+            with open(tmpfile, 'wb') as fp:
+                marshal.dump((FORMAT_VERSION, entry), fp)
+            os.replace(tmpfile, file)
+        except OSError:
+            pass
+
+
+def compiled_folder():
+    """
+    Returns the folder containing the configurations compiled via ``score conf
+    compile``.
+    """
+    return os.path.join(rootdir(), 'compiled')
+
+
+def chain(file, confdict):
+    """
+    Returns all files involved in parsing the configuration *file*, given its
+    parsed *confdict*.
+    """
+    files = [os.path.abspath(file)]
+    try:
+        extra = confdict['score.init']['_files']
+    except KeyError:
+        extra = ''
+    for line in extra.split('\n'):
+        line = line.strip()
+        if line and line not in files:
+            files.append(line)
+    return tuple(files)
+
+
+def include_patterns(files):
+    """
+    Returns the glob patterns of all ``score.init/include`` declarations in
+    given configuration *files*, as returned by :func:`.chain`. Files matching
+    one of the patterns are included files, whose own include declarations
+    are ignored by :func:`score.init.parse_config_file`.
+    """
+    declarations = []
+    for file in files:
+        try:
+            settings = parse_config_file(file, recurse=False)
+            includes = settings['score.init']['include']
+        except (OSError, KeyError, configparser.Error):
+            continue
+        declarations.append((file, parse_list(includes)))
+    included = set()
+    for file, patterns in declarations:
+        for pattern in patterns:
+            included.update(os.path.abspath(match) for match in glob(pattern))
+    result = []
+    for file, patterns in declarations:
+        if os.path.abspath(file) in included:
+            continue
+        for pattern in patterns:
+            if pattern not in result:
+                result.append(pattern)
+    return tuple(result)
+
+
+def fingerprint(files, patterns=()):
+    """
+    Returns a value that changes whenever one of the given *files* is
+    modified, replaced or deleted, or whenever the set of files matching one
+    of the given glob *patterns* changes. It consists of the modification
+    time, size and inode of each file and the sorted matches of each pattern.
+    """
+    return _stat(files) + _matches(patterns)
+
+
+def _stat(files):
+    result = []
+    for file in files:
+        try:
+            stat = os.stat(file)
+        except OSError:
+            result.append(None)
+        else:
+            result.append((stat.st_mtime_ns, stat.st_size, stat.st_ino))
+    return tuple(result)
+
+
+def _matches(patterns):
+    return tuple(tuple(sorted(glob(pattern))) for pattern in patterns)
+
+
+def _uses_cwd(files):
+    """
+    Checks whether any of given configuration *files* refers to the current
+    working directory, which would make the parsed result depend on it.
+    """
+    for file in files:
+        try:
+            with open(file) as fp:
+                if 'cwd}' in fp.read():
+                    return True
+        except OSError:
+            pass
+    return False
+
+
+def _freeze(confdict):
+    return tuple((section, tuple(values.items()))
+                 for section, values in confdict.items())
+
+
+def _thaw(frozen):
+    return OrderedDict((section, OrderedDict(values))
+                       for section, values in frozen)
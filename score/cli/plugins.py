@@ -0,0 +1,277 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import json
+import os
+import sys
+
+import click
+
+from . import entrypoints
+from .conf import rootdir
+
+
+def manifest_file():
+    """
+    Returns the path to the manifest written by ``score plugins warm``.
+    """
+    return os.path.join(rootdir(), 'cache', 'plugins.json')
+
+
+def pycache_folder():
+    """
+    Returns the folder receiving the bytecode of all plugins, if the folders
+    containing them are not writable.
+    """
+    return os.path.join(rootdir(), 'pycache')
+
+
+_manifest = None
+
+
+def read_manifest():
+    """
+    Returns the contents of the :func:`manifest <manifest_file>` as a `dict`,
+    or `None`, if there is no manifest or if the installed plugins have
+    changed since it was written. The manifest is read once per process.
+    """
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(manifest_file()) as fp:
+                _manifest = json.load(fp)
+        except (OSError, ValueError):
+            _manifest = {}
+    if _manifest.get('index') != _index_fingerprint():
+        return None
+    return _manifest
+
+
+def manifest_error(name):
+    """
+    Returns the error ``score plugins warm`` encountered while loading the
+    command with given *name*, or `None`, if the command loaded successfully
+    or if there is no valid manifest.
+    """
+    manifest = read_manifest()
+    if manifest is None:
+        return None
+    plugin = manifest['plugins'].get(name)
+    if plugin is None or plugin['ok']:
+        return None
+    return plugin['error']
+
+
+_applied = False
+_explicit_prefix = sys.pycache_prefix
+
+
+def apply_pycache_prefix():
+    """
+    Sets :data:`sys.pycache_prefix` to the folder the plugins were compiled
+    into, if ``score plugins warm`` decided to use one and the installed
+    plugins did not change since. Does nothing if a prefix was configured
+    explicitly, via :envvar:`PYTHONPYCACHEPREFIX` for example.
+
+    This is called before the first plugin is loaded.
+    """
+    global _applied
+    if _applied:
+        return
+    _applied = True
+    if sys.pycache_prefix is not None:
+        return
+    manifest = read_manifest()
+    if manifest and manifest.get('pycache_prefix'):
+        sys.pycache_prefix = manifest['pycache_prefix']
+
+
+def warm(*, jobs=None, pycache_prefix=None):
+    """
+    Loads all ``score.cli`` entry points in parallel and compiles the bytecode
+    of all modules they use, as well as the packages they are defined in.
+    Returns the manifest, which is also written to :func:`.manifest_file`.
+
+    The bytecode is written to :func:`.pycache_folder` if *pycache_prefix* is
+    truthy. The default value `None` will do so only if one of the plugin
+    folders is not writable.
+    """
+    import multiprocessing
+    commands = entrypoints.commands(refresh=True)
+    if _explicit_prefix is not None:
+        prefix = _explicit_prefix
+    elif pycache_prefix is None:
+        prefix = None
+        if not all(map(_writable, commands.values())):
+            prefix = pycache_folder()
+    else:
+        prefix = pycache_folder() if pycache_prefix else None
+    tasks = [(plugin.name, plugin.value, plugin.dist)
+             for plugins in commands.values() for plugin in plugins]
+    results = {}
+    # each plugin is loaded in a fresh interpreter, which does not contain
+    # the modules of this process or of any other plugin
+    context = multiprocessing.get_context('spawn')
+    with context.Pool(jobs, maxtasksperchild=1) as pool:
+        futures = [pool.apply_async(_warm, (name, value, dist, prefix))
+                   for name, value, dist in tasks]
+        for (name, value, dist), future in zip(tasks, futures):
+            try:
+                result = future.get()
+            except Exception as e:
+                result = {'error': _describe(e), 'modules': 0, 'failed': []}
+            result.update(value=value, dist=dist)
+            results.setdefault(name, []).append(result)
+    manifest = {
+        'index': _index_fingerprint(),
+        'pycache_prefix': prefix,
+        'plugins': {},
+    }
+    for name in sorted(results):
+        entries = results[name]
+        error = None
+        if len(entries) > 1:
+            error = 'Entry point "%s" found in multiple packages:' % name
+            for entry in entries:
+                error += '\n - %s' % entry['dist']
+        for entry in entries:
+            error = error or entry['error']
+        manifest['plugins'][name] = {
+            'ok': error is None,
+            'error': error,
+            'entries': entries,
+        }
+    global _manifest
+    file = manifest_file()
+    os.makedirs(os.path.dirname(file), exist_ok=True)
+    tmpfile = '%s.%d' % (file, os.getpid())
+    with open(tmpfile, 'w') as fp:
+        json.dump(manifest, fp, indent=2)
+    os.replace(tmpfile, file)
+    _manifest = manifest
+    return manifest
+
+
+def _warm(name, value, dist, prefix):
+    """
+    Loads a single entry point and compiles all modules it needs, including
+    the ones the ``score`` command itself imports before loading it. Runs in
+    a fresh worker process and reports the number of modules the entry point
+    loaded.
+    """
+    global _applied
+    import compileall
+    _applied = True
+    sys.pycache_prefix = prefix
+    before = set(sys.modules)
+    error = None
+    try:
+        entrypoints.EntryPoint(name, value, dist).load()
+    except Exception as e:
+        error = _describe(e)
+    files = set()
+    loaded = 0
+    for modname, module in list(sys.modules.items()):
+        file = getattr(module, '__file__', None)
+        if file and file.endswith('.py'):
+            files.add(file)
+            loaded += modname not in before
+    failed = [file for file in sorted(files)
+              if not compileall.compile_file(file, quiet=2)]
+    package = sys.modules.get(value.partition(':')[0].strip().rpartition(
+        '.')[0])
+    for folder in getattr(package, '__path__', []):
+        if not compileall.compile_dir(folder, quiet=2):
+            failed.append(folder)
+    return {'error': error, 'modules': loaded, 'failed': failed}
+
+
+def _describe(exception):
+    return '%s: %s' % (type(exception).__name__, exception)
+
+
+def _writable(plugins):
+    import importlib.util
+    for plugin in plugins:
+        module = plugin.value.partition(':')[0].strip()
+        try:
+            spec = importlib.util.find_spec(module)
+        except Exception:
+            continue
+        if spec is None or not spec.origin or not os.path.isfile(spec.origin):
+            continue
+        folder = os.path.join(os.path.dirname(spec.origin), '__pycache__')
+        if not os.path.isdir(folder):
+            folder = os.path.dirname(folder)
+        if not os.access(folder, os.W_OK):
+            return False
+    return True
+
+
+def _index_fingerprint():
+    entrypoints.commands()
+    return entrypoints._data['fingerprint']
+
+
+@click.group('plugins')
+def main():
+    """
+    Manages the plugins providing commands.
+    """
+
+
+@main.command('warm')
+@click.option('-j', '--jobs', type=int,
+              help='Number of plugins to compile in parallel.')
+@click.option('--pycache-prefix/--no-pycache-prefix', 'pycache_prefix',
+              default=None,
+              help='Write bytecode to a separate folder. The default is to '
+              'do so only if the plugin folders are not writable.')
+def warm_(jobs=None, pycache_prefix=None):
+    """
+    Compiles and validates all plugins.
+    """
+    manifest = warm(jobs=jobs, pycache_prefix=pycache_prefix)
+    failed = 0
+    for name, plugin in manifest['plugins'].items():
+        modules = sum(entry['modules'] for entry in plugin['entries'])
+        if plugin['ok']:
+            click.echo('%s: ok (%d modules)' % (name, modules))
+        else:
+            failed += 1
+            click.echo('%s: %s' % (name, plugin['error']))
+        for entry in plugin['entries']:
+            for file in entry['failed']:
+                click.echo('  could not compile %s' % file, err=True)
+    if manifest['pycache_prefix']:
+        click.echo('bytecode written to %s' % manifest['pycache_prefix'])
+    if failed:
+        raise click.ClickException(
+            '%d of %d plugins failed' % (failed, len(manifest['plugins'])))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,282 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+"""
+Optional instrumentation of the ``score`` command's startup phases.
+
+This module must not import anything but standard library modules, since it
+is imported before all other dependencies of :mod:`score.cli` in order to be
+able to time their imports, too.
+"""
+
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+
+FORMATS = ('table', 'json')
+
+_recorder = None
+
+
+class Recorder:
+    """
+    Collects the durations of all :func:`phases <.phase>` and the import time
+    of every module imported while it is active.
+    """
+
+    def __init__(self, format='table', file=None):
+        if format not in FORMATS:
+            raise ValueError('Invalid profile format: %s' % format)
+        self.format = format
+        self.file = file
+        self.start = time.perf_counter()
+        self.phases = []
+        self.imports = []
+        self._import_stack = []
+        self._finder = _ImportTimer(self)
+
+    @contextmanager
+    def phase(self, name, detail=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append({
+                'name': name,
+                'detail': detail,
+                'start': start - self.start,
+                'duration': time.perf_counter() - start,
+            })
+
+    def report(self):
+        """
+        Returns the collected timings in the configured format.
+        """
+        total = time.perf_counter() - self.start
+        imports = sorted(self.imports, key=lambda i: -i['cumulative'])
+        if self.format == 'json':
+            return json.dumps({
+                'total': total,
+                'phases': self.phases,
+                'imports': imports,
+            }, indent=2) + '\n'
+        lines = ['%-12s %-40s %9s %9s' % (
+            'phase', 'detail', 'start', 'duration')]
+        for phase in self.phases:
+            lines.append('%-12s %-40s %8.1fms %8.1fms' % (
+                phase['name'], _shorten(phase['detail'] or ''),
+                phase['start'] * 1000, phase['duration'] * 1000))
+        lines.append('%-12s %-40s %9s %8.1fms' % (
+            'total', '', '', total * 1000))
+        if imports:
+            lines.append('')
+            lines.append('%-53s %9s %9s' % ('module', 'self', 'cumulative'))
+            for item in imports[:25]:
+                lines.append('%-53s %8.1fms %8.1fms' % (
+                    _shorten(item['module'], 53),
+                    item['self'] * 1000, item['cumulative'] * 1000))
+            if len(imports) > 25:
+                lines.append('(%d more modules)' % (len(imports) - 25))
+        return '\n'.join(lines) + '\n'
+
+    def write(self):
+        """
+        Writes the :meth:`.report` to the configured file, or to stderr.
+        """
+        if self.file:
+            with open(self.file, 'w') as fp:
+                fp.write(self.report())
+        else:
+            sys.stderr.write(self.report())
+
+
+class _ImportTimer:
+    """
+    Meta path finder wrapping the loaders found by all other finders with a
+    :class:`_TimedLoader`.
+    """
+
+    def __init__(self, recorder):
+        self.recorder = recorder
+
+    def find_spec(self, name, path, target=None):
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, 'find_spec'):
+                continue
+            spec = finder.find_spec(name, path, target)
+            if spec is None:
+                continue
+            if hasattr(spec.loader, 'exec_module'):
+                spec.loader = _TimedLoader(spec.loader, self.recorder)
+            return spec
+        return None
+
+
+class _TimedLoader:
+
+    def __init__(self, loader, recorder):
+        self._loader = loader
+        self._recorder = recorder
+
+    def __getattr__(self, attr):
+        return getattr(self._loader, attr)
+
+    def create_module(self, spec):
+        return self._loader.create_module(spec)
+
+    def exec_module(self, module):
+        stack = self._recorder._import_stack
+        # every entry holds the time spent in nested imports
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            self._loader.exec_module(module)
+        finally:
+            cumulative = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += cumulative
+            self._recorder.imports.append({
+                'module': module.__name__,
+                'self': cumulative - nested,
+                'cumulative': cumulative,
+            })
+
+
+def _shorten(text, length=40):
+    if len(text) <= length:
+        return text
+    return '...' + text[-length + 3:]
+
+
+def parse_spec(spec):
+    """
+    Parses a profile specification of the form ``FORMAT[:FILE]`` and returns
+    the format and the file, which may be `None`.
+    """
+    format, _, file = spec.partition(':')
+    return format, file or None
+
+
+def enable(format='table', file=None):
+    """
+    Starts recording. Does nothing if recording was already enabled.
+    """
+    global _recorder
+    if _recorder is not None:
+        return _recorder
+    _recorder = Recorder(format, file)
+    sys.meta_path.insert(0, _recorder._finder)
+    return _recorder
+
+
+def disable():
+    """
+    Stops recording and returns the active :class:`.Recorder`, if there was
+    one.
+    """
+    global _recorder
+    recorder, _recorder = _recorder, None
+    if recorder is not None and recorder._finder in sys.meta_path:
+        sys.meta_path.remove(recorder._finder)
+    return recorder
+
+
+def reset():
+    """
+    Stops recording and removes all :func:`observers <.observe>` without
+    reporting anything. Forked child processes call this to discard the
+    state inherited from their parent.
+    """
+    disable()
+    del _observers[:]
+
+
+class _NullPhase:
+
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *args):
+        pass
+
+
+_null_phase = _NullPhase()
+
+
+_observers = []
+
+
+def observe(callback):
+    """
+    Registers a *callback*, which will receive the name, the detail and the
+    duration of every finished :func:`.phase`, whether recording is enabled
+    or not.
+    """
+    _observers.append(callback)
+
+
+def unobserve(callback):
+    """
+    Removes a *callback* registered via :func:`.observe`.
+    """
+    if callback in _observers:
+        _observers.remove(callback)
+
+
+def phase(name, detail=None):
+    """
+    Returns a context manager timing the enclosed block as a phase with given
+    *name* and an optional *detail*, if recording is enabled or if there are
+    :func:`observers <.observe>`.
+    """
+    if _observers:
+        return _observed_phase(name, detail)
+    if _recorder is None:
+        return _null_phase
+    return _recorder.phase(name, detail)
+
+
+@contextmanager
+def _observed_phase(name, detail):
+    start = time.perf_counter()
+    try:
+        if _recorder is None:
+            yield
+        else:
+            with _recorder.phase(name, detail):
+                yield
+    finally:
+        duration = time.perf_counter() - start
+        for observer in list(_observers):
+            observer(name, detail, duration)
+
+
+if os.getenv('SCORE_CLI_PROFILE'):
+    enable(*parse_spec(os.getenv('SCORE_CLI_PROFILE')))
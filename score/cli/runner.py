@@ -0,0 +1,256 @@
+# Copyright © 2015-2018 STRG.AT GmbH, Vienna, Austria
+#
+# This file is part of the The SCORE Framework.
+#
+# The SCORE Framework and all its parts are free software: you can redistribute
+# them and/or modify them under the terms of the GNU Lesser General Public
+# License version 3 as published by the Free Software Foundation which is in
+# the file named COPYING.LESSER.txt.
+#
+# The SCORE Framework and all its parts are distributed without any WARRANTY;
+# without even the implied warranty of MERCHANTABILITY or FITNESS FOR A
+# PARTICULAR PURPOSE. For more details see the GNU Lesser General Public
+# License.
+#
+# If you have not received a copy of the GNU Lesser General Public License see
+# http://www.gnu.org/licenses/.
+#
+# The License-Agreement realised between you as Licensee and STRG.AT GmbH as
+# Licenser including the issue of its valid conclusion and its pre- and
+# post-contractual effects is governed by the laws of Austria. Any disputes
+# concerning this License-Agreement including the issue of its valid conclusion
+# and its pre- and post-contractual effects are exclusively decided by the
+# competent court, in whose district STRG.AT GmbH has its registered seat, at
+# the discretion of STRG.AT GmbH also the competent court, in whose district
+# the Licensee has his registered seat, an establishment or assets.
+
+import os
+import signal
+import sys
+import tempfile
+import traceback
+
+from . import entrypoints, metrics, profile
+from .clibase import Configuration, main
+from .conf import get_file
+from .parsecache import fingerprint
+
+
+class Preloader:
+    """
+    Runs ``score`` commands in the current process or in forked child
+    processes, while keeping the initialized :class:`.Configuration` objects
+    and the imported plugins around for later commands.
+
+    Forked children share all preloaded objects with their parent
+    copy-on-write. All score modules initialized this way must thus be safe to
+    use after a fork.
+    """
+
+    def __init__(self):
+        self.configurations = {}
+        self._files = {}
+
+    def preload(self, argv):
+        """
+        Initializes the configuration and imports the plugin the command given
+        as an argument list would use. Configurations that were initialized
+        earlier are re-initialized, if one of the files they were assembled
+        from has changed in the meantime.
+
+        Failures are ignored, the command is expected to report them when it
+        is actually run.
+        """
+        conf, command = parse_argv(argv)
+        try:
+            self._preload_configuration(conf)
+        except Exception:
+            pass
+        plugins = entrypoints.commands().get(command, [])
+        if len(plugins) == 1:
+            try:
+                plugins[0].load()
+            except Exception:
+                pass
+
+    def _preload_configuration(self, conf):
+        if conf and os.path.isfile(conf):
+            conf = os.path.abspath(conf)
+        elif conf:
+            conf = get_file(conf)
+        for key in ((conf, None), (conf, os.getcwd())):
+            configuration = self.configurations.get(key)
+            if configuration is None:
+                continue
+            files, patterns, stored = self._files[key]
+            if fingerprint(files, patterns) == stored:
+                return
+            configuration.invalidate()
+            del self.configurations[key]
+            del self._files[key]
+        configuration = Configuration(conf)
+        configuration.parse()
+        cache = configuration.parse_cache
+        path = configuration.path
+        files = cache.files(path)
+        patterns = cache.includes(path)
+        configuration.load()
+        # configurations depending on the working directory are only re-used
+        # in the directory they were initialized in
+        key = (conf, os.getcwd() if cache.depends_on_cwd(path) else None)
+        self.configurations[key] = configuration
+        self._files[key] = (files, patterns, fingerprint(files, patterns))
+
+    def resident(self):
+        """
+        Returns a `dict` mapping configuration files to the preloaded
+        :class:`.Configuration` objects usable in the current working
+        directory.
+        """
+        cwd = os.getcwd()
+        return dict((conf, configuration)
+                    for (conf, folder), configuration
+                    in self.configurations.items()
+                    if folder is None or folder == cwd)
+
+    def run(self, argv):
+        """
+        Runs the command given as an argument list in the current process and
+        returns its exit code.
+        """
+        try:
+            main.main(args=list(argv), prog_name='score',
+                      obj={'resident': self.resident()})
+        except SystemExit as e:
+            code = e.code
+        else:
+            code = 0
+        if code is None:
+            return 0
+        if not isinstance(code, int):
+            print(code, file=sys.stderr)
+            return 1
+        return code
+
+    def fork(self, argv, *, stdin=0, stdout=1, stderr=2, cwd=None, env=None,
+             report=None):
+        """
+        Runs the command given as an argument list in a forked child process
+        and returns the child's pid. The child process will use the given
+        file descriptors for its standard streams and may optionally run in a
+        different working directory *cwd* and with a different environment
+        *env*.
+
+        The child process passes the exit code of the command to the callable
+        *report*, if one was provided, before exiting with that code.
+        """
+        sys.stdout.flush()
+        sys.stderr.flush()
+        pid = os.fork()
+        if pid:
+            return pid
+        code = 1
+        try:
+            # the child reports its own phases and metrics
+            metrics.reset()
+            profile.reset()
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            for fd, target in ((stdin, 0), (stdout, 1), (stderr, 2)):
+                if fd != target:
+                    os.dup2(fd, target)
+            if cwd is not None:
+                os.chdir(cwd)
+            if env is not None:
+                os.environ.clear()
+                os.environ.update(env)
+            code = self.run(argv)
+        except BaseException:
+            traceback.print_exc()
+        finally:
+            try:
+                sys.stdout.flush()
+                sys.stderr.flush()
+                if report:
+                    report(code)
+            finally:
+                os._exit(code & 0xff)
+
+    def run_parallel(self, commands, *, jobs=None, preload=True):
+        """
+        Runs all given *commands*, which must be argument lists, in
+        :meth:`forked <.fork>` child processes. At most *jobs* commands are
+        run at the same time, the default is the number of CPUs. The
+        configuration and plugin of each command are :meth:`preloaded
+        <.preload>`, unless *preload* is falsy.
+
+        The standard input of the commands is empty, their standard output
+        and error are captured. Yields a tuple containing the index of the
+        command in *commands*, its exit code and its output as soon as a
+        command finishes.
+        """
+        jobs = jobs or os.cpu_count() or 1
+        pending = list(enumerate(commands))
+        running = {}
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        try:
+            while pending or running:
+                while pending and len(running) < jobs:
+                    index, argv = pending.pop(0)
+                    if preload:
+                        self.preload(argv)
+                    output = tempfile.TemporaryFile()
+                    pid = self.fork(argv, stdin=devnull,
+                                    stdout=output.fileno(),
+                                    stderr=output.fileno())
+                    running[pid] = (index, output)
+                pid, status = os.wait()
+                if pid not in running:
+                    continue
+                index, output = running.pop(pid)
+                with output:
+                    output.seek(0)
+                    yield index, exitcode(status), output.read()
+        finally:
+            os.close(devnull)
+            for _, output in running.values():
+                output.close()
+
+
+def exitcode(status):
+    """
+    Converts a process *status* as returned by :func:`os.wait` to an exit
+    code. Processes killed by a signal get the negative signal number.
+    """
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+
+# options of the `score' command taking a value
+_VALUE_OPTIONS = ('-j', '--jobs', '--max-workers', '--profile-startup')
+
+
+def parse_argv(argv):
+    """
+    Extracts the configuration given via ``-c``/``--conf`` and the name of the
+    sub-command from given ``score`` argument list. Both values are `None`, if
+    they are not present.
+    """
+    conf = None
+    argv = list(argv)
+    while argv:
+        arg = argv.pop(0)
+        if arg in ('-c', '--conf'):
+            if argv:
+                conf = argv.pop(0)
+        elif arg.startswith('--conf='):
+            conf = arg[len('--conf='):]
+        elif arg.startswith('-c'):
+            conf = arg[2:]
+        elif arg in _VALUE_OPTIONS:
+            argv[:1] = []
+        elif arg == '--':
+            return conf, argv[0] if argv else None
+        elif not arg.startswith('-'):
+            return conf, arg
+    return conf, None
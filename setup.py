@@ -44,6 +44,7 @@ setup(
     packages=['score', 'score.cli'],
     namespace_packages=['score'],
     zip_safe=False,
+    python_requires='>=3.8',
     license='LGPL',
     classifiers=[
         'Development Status :: 4 - Beta',
@@ -53,8 +54,7 @@ setup(
             'Public License v3 or later (LGPLv3+)',
         'Operating System :: OS Independent',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.4',
-        'Programming Language :: Python :: 3.5',
+        'Programming Language :: Python :: 3.8',
         'Topic :: Software Development :: Libraries :: Application Frameworks',
     ],
     install_requires=[
@@ -67,6 +67,10 @@ setup(
         ],
         'score.cli': [
             'conf = score.cli.cli:main',
+            'completion = score.cli.completion:main',
+            'daemon = score.cli.daemon:main',
+            'batch = score.cli.batch:main',
+            'plugins = score.cli.plugins:main',
         ],
     },
 )